@@ -2,7 +2,7 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import simpledialog
 from PIL import ImageTk, Image
-from google.cloud import vision
+from ocrclient import default_ocr
 import webbrowser
 import io
 import re
@@ -13,6 +13,10 @@ from dotenv import load_dotenv
 from requests_oauthlib import OAuth2Session
 from PIL.ExifTags import TAGS
 import threading
+import sys
+import argparse
+import profiling
+from thumbnailcache import ThumbnailCache
 
 # Load environment variables
 load_dotenv()
@@ -24,6 +28,8 @@ STRAVA_API_URL = "https://www.strava.com/api/v3"
 STRAVA_AUTH_URL = "https://www.strava.com/oauth/authorize"
 STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
 
+thumbnail_cache = ThumbnailCache()
+
 
 def refresh_access_token():
     global access_token  # Ensure you update the global access_token variable
@@ -126,12 +132,10 @@ def get_image_datetime(image_path):
 
 
 def extract_text_from_image(image_path):
-    client = vision.ImageAnnotatorClient()
     with io.open(image_path, 'rb') as image_file:
         content = image_file.read()
-    image = vision.Image(content=content)
-    response = client.text_detection(image=image)
-    texts = response.text_annotations
+    # Shared client with deadlines, hedging and a circuit breaker
+    texts = default_ocr.text_detection(content)
     if texts:
         return texts[0].description.replace(" ", "")
     else:
@@ -280,27 +284,9 @@ class StravaApp:
             threading.Thread(target=self.process_image, args=(file_path,)).start()  # Use a thread to process image in background
 
     def display_image(self, image_path):
-        image = Image.open(image_path)
-        
-        # Check EXIF data for orientation and rotate if needed
-        try:
-            exif = image._getexif()
-            if exif is not None:
-                orientation = next((tag for tag, value in exif.items() if TAGS.get(tag) == 'Orientation'), None)
-                if orientation:
-                    if exif[orientation] == 3:
-                        image = image.rotate(180, expand=True)
-                    elif exif[orientation] == 6:
-                        image = image.rotate(270, expand=True)
-                    elif exif[orientation] == 8:
-                        image = image.rotate(90, expand=True)
-        except (AttributeError, KeyError, IndexError):
-            # In case there's no EXIF or it doesn't have the Orientation tag
-            pass
-        
-        # Resize the image to fit within a specified maximum size, maintaining aspect ratio
+        # Load the oriented, resized thumbnail from the shared cache
         max_size = 500  # Maximum size of the image
-        image.thumbnail((max_size, max_size))  # Resize while maintaining aspect ratio
+        image = thumbnail_cache.get_image(image_path, max_size)
         
         # Create a Tkinter-compatible photo image
         img = ImageTk.PhotoImage(image)
@@ -417,6 +403,13 @@ class StravaApp:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Treadmill to Strava (Tkinter)")
+    parser.add_argument('--profile', metavar='DIR', help=f"Write cProfile/tracemalloc reports to DIR (or set {profiling.PROFILE_ENV})")
+    args = parser.parse_args()
+    profiling.setup(args.profile)
+    profiling.instrument(sys.modules[__name__], ['extract_text_from_image', 'upload_activity_to_strava'])
+    profiling.instrument(StravaApp, ['process_image', 'display_image'])
+
     root = tk.Tk()
     app = StravaApp(root)
     root.mainloop()
\ No newline at end of file
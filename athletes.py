@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import requests
+from cryptography.fernet import Fernet
+from requests_oauthlib import OAuth2Session
+from treadmilltostrava import (
+    STRAVA_API_URL,
+    STRAVA_AUTH_URL,
+    STRAVA_TOKEN_URL,
+    build_activity_data,
+    extract_text_from_image,
+    extract_time_and_distance,
+)
+
+# Serving a whole club from one process:
+# - AthleteStore keeps every athlete's Strava tokens encrypted on disk
+# - SessionCache keeps an LRU of warm, authenticated sessions and refreshes a
+#   token lazily, only when it is about to expire
+# - AthleteDispatcher gives every athlete their own work queue. A worker only
+#   ever handles one job per athlete at a time and athletes take turns, so one
+#   athlete's backlog, rate budget or dead token never holds up the others.
+
+STORE_PATH = os.getenv('ATHLETE_STORE_PATH', 'athletes.json')
+STORE_KEY_ENV = 'ATHLETE_STORE_KEY'  # Generate one with: python athletes.py genkey
+REFRESH_MARGIN = 300  # Refresh tokens that expire within this many seconds
+DEFAULT_WARM_SESSIONS = 32
+# Per-athlete upload budget: at most this many uploads per window
+DEFAULT_BUDGET_UPLOADS = int(os.getenv('ATHLETE_BUDGET_UPLOADS', '20'))
+DEFAULT_BUDGET_WINDOW = float(os.getenv('ATHLETE_BUDGET_WINDOW_SECONDS', '900'))
+
+
+class TokenError(Exception):
+    pass
+
+
+class AthleteStore:
+    def __init__(self, path=STORE_PATH, key=None):
+        key = key or os.getenv(STORE_KEY_ENV)
+        if not key:
+            raise TokenError(f"Set {STORE_KEY_ENV} to encrypt the athlete token store.")
+        self.path = path
+        self.fernet = Fernet(key)
+        self.lock = threading.Lock()
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, 'r') as store_file:
+                self.records = json.load(store_file)
+
+    def athlete_ids(self):
+        with self.lock:
+            return list(self.records)
+
+    def load_tokens(self, athlete_id):
+        with self.lock:
+            record = self.records.get(str(athlete_id))
+        if record is None:
+            raise TokenError(f"No tokens stored for athlete {athlete_id}.")
+        return json.loads(self.fernet.decrypt(record.encode()))
+
+    def save_tokens(self, athlete_id, tokens):
+        data = {key: tokens[key] for key in ('access_token', 'refresh_token', 'expires_at')}
+        record = self.fernet.encrypt(json.dumps(data).encode()).decode()
+        with self.lock:
+            self.records[str(athlete_id)] = record
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(self.records, tmp_file, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class SessionCache:
+    def __init__(self, store, capacity=DEFAULT_WARM_SESSIONS):
+        self.store = store
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        # athlete_id -> (session, expires_at), least recently used first
+        self.sessions = OrderedDict()
+        self.refresh_locks = {}
+
+    def _refresh_lock(self, athlete_id):
+        with self.lock:
+            return self.refresh_locks.setdefault(athlete_id, threading.Lock())
+
+    def get(self, athlete_id, force_refresh=False):
+        # A session with a valid Authorization header, refreshing the token if needed
+        with self.lock:
+            entry = self.sessions.get(athlete_id)
+            if entry is not None:
+                self.sessions.move_to_end(athlete_id)
+        if entry is not None and not force_refresh and entry[1] - time.time() > REFRESH_MARGIN:
+            return entry[0]
+
+        # Only one thread refreshes a given athlete; the others wait and reuse its result
+        with self._refresh_lock(athlete_id):
+            with self.lock:
+                current = self.sessions.get(athlete_id)
+            if current is not None and current is not entry and current[1] - time.time() > REFRESH_MARGIN:
+                return current[0]
+
+            tokens = self.store.load_tokens(athlete_id)
+            if force_refresh or tokens['expires_at'] - time.time() <= REFRESH_MARGIN:
+                tokens = self._refresh(athlete_id, tokens)
+            session = entry[0] if entry is not None else requests.Session()
+            session.headers["Authorization"] = f"Bearer {tokens['access_token']}"
+            self._put(athlete_id, session, tokens['expires_at'])
+            return session
+
+    def _refresh(self, athlete_id, tokens):
+        response = requests.post(STRAVA_TOKEN_URL, {
+            "client_id": os.getenv('STRAVA_CLIENT_ID'),
+            "client_secret": os.getenv('STRAVA_CLIENT_SECRET'),
+            "refresh_token": tokens['refresh_token'],
+            "grant_type": "refresh_token",
+        }, timeout=30)
+        if response.status_code != 200:
+            raise TokenError(f"Failed to refresh token for athlete {athlete_id}: {response.content}")
+        tokens = response.json()
+        self.store.save_tokens(athlete_id, tokens)
+        return tokens
+
+    def _put(self, athlete_id, session, expires_at):
+        with self.lock:
+            self.sessions[athlete_id] = (session, expires_at)
+            self.sessions.move_to_end(athlete_id)
+            while len(self.sessions) > self.capacity:
+                _, (evicted, _) = self.sessions.popitem(last=False)
+                evicted.close()
+
+
+def upload_for_athlete(sessions, athlete_id, time_value, distance, image_path, title, description):
+    activity_data = build_activity_data(time_value, distance, image_path, title, description)
+    response = sessions.get(athlete_id).post(f"{STRAVA_API_URL}/activities", data=activity_data, timeout=30)
+    if response.status_code == 401:
+        # Revoked or expired early: refresh once and retry
+        response = sessions.get(athlete_id, force_refresh=True).post(
+            f"{STRAVA_API_URL}/activities", data=activity_data, timeout=30)
+    return response
+
+
+class RateBudget:
+    # Sliding window of upload times for one athlete
+    def __init__(self, uploads=DEFAULT_BUDGET_UPLOADS, window=DEFAULT_BUDGET_WINDOW):
+        self.uploads = uploads
+        self.window = window
+        self.times = deque()
+
+    def wait_time(self):
+        now = time.monotonic()
+        while self.times and now - self.times[0] >= self.window:
+            self.times.popleft()
+        if len(self.times) < self.uploads:
+            return 0.0
+        return self.window - (now - self.times[0])
+
+    def spend(self):
+        self.times.append(time.monotonic())
+
+
+class AthleteDispatcher:
+    def __init__(self, sessions, workers=8, budget_uploads=DEFAULT_BUDGET_UPLOADS,
+                 budget_window=DEFAULT_BUDGET_WINDOW):
+        self.sessions = sessions
+        self.budget_uploads = budget_uploads
+        self.budget_window = budget_window
+        self.condition = threading.Condition()
+        self.queues = {}  # athlete_id -> deque of (future, job)
+        self.budgets = {}
+        self.ready = deque()  # Athletes with queued work that no worker holds
+        self.active = set()
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, athlete_id, image_path, title="Treadmill Run", description="Uploaded from TreadmilltoStrava"):
+        future = Future()
+        with self.condition:
+            shard = self.queues.setdefault(athlete_id, deque())
+            shard.append((future, (image_path, title, description)))
+            self._mark_ready(athlete_id)
+        return future
+
+    def backlog(self):
+        with self.condition:
+            return {athlete_id: len(shard) for athlete_id, shard in self.queues.items() if shard}
+
+    def _mark_ready(self, athlete_id):
+        # Called with the condition held
+        if athlete_id not in self.active and athlete_id not in self.ready and self.queues.get(athlete_id):
+            self.ready.append(athlete_id)
+            self.condition.notify()
+
+    def _requeue_later(self, athlete_id, delay):
+        def requeue():
+            with self.condition:
+                self._mark_ready(athlete_id)
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        timer.start()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.ready:
+                    self.condition.wait()
+                athlete_id = self.ready.popleft()
+                budget = self.budgets.setdefault(athlete_id, RateBudget(self.budget_uploads, self.budget_window))
+                delay = budget.wait_time()
+                if delay > 0:
+                    # Out of budget: park this athlete, everyone else carries on
+                    self._requeue_later(athlete_id, delay)
+                    continue
+                future, job = self.queues[athlete_id].popleft()
+                budget.spend()
+                self.active.add(athlete_id)
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self._process(athlete_id, *job))
+                except Exception as e:
+                    future.set_exception(e)
+
+            with self.condition:
+                self.active.discard(athlete_id)
+                # Back of the line, so athletes take turns
+                self._mark_ready(athlete_id)
+
+    def _process(self, athlete_id, image_path, title, description):
+        text = extract_text_from_image(image_path)
+        time_value, distance = extract_time_and_distance(text)
+        if time_value == 'Time not found' or distance == 'Distance not found':
+            raise ValueError("Time or distance not found in the image.")
+        response = upload_for_athlete(self.sessions, athlete_id, time_value, distance, image_path,
+                                      title, description)
+        return {"athlete_id": athlete_id, "path": image_path, "time": time_value, "distance": distance,
+                "status_code": response.status_code}
+
+
+def authorize_athlete(store):
+    # One-off OAuth flow for a club member; their tokens go into the encrypted store
+    session = OAuth2Session(client_id=os.getenv('STRAVA_CLIENT_ID'), redirect_uri=os.getenv('STRAVA_REDIRECT_URI'))
+    session.scope = ["activity:write"]
+    auth_link = session.authorization_url(STRAVA_AUTH_URL)
+    print(f"Click Here to authorize the app: {auth_link[0]}")
+    authorization_response = input('Enter the full callback URL: ')
+    token = session.fetch_token(
+        token_url=STRAVA_TOKEN_URL,
+        client_id=os.getenv('STRAVA_CLIENT_ID'),
+        client_secret=os.getenv('STRAVA_CLIENT_SECRET'),
+        authorization_response=authorization_response,
+        include_client_id=True,
+    )
+    athlete_id = str(token.get('athlete', {}).get('id') or input('Athlete id: '))
+    store.save_tokens(athlete_id, token)
+    print(f"Stored tokens for athlete {athlete_id}.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage club athletes and upload on their behalf")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('genkey', help="Print a new key for the token store")
+    commands.add_parser('add', help="Authorize an athlete and store their tokens")
+    commands.add_parser('list', help="List stored athletes")
+    upload_parser = commands.add_parser('upload', help="Upload photos for an athlete")
+    upload_parser.add_argument('athlete_id')
+    upload_parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'genkey':
+        print(Fernet.generate_key().decode())
+        sys.exit(0)
+
+    store = AthleteStore()
+    if args.command == 'add':
+        authorize_athlete(store)
+    elif args.command == 'list':
+        for athlete_id in store.athlete_ids():
+            print(athlete_id)
+    elif args.command == 'upload':
+        dispatcher = AthleteDispatcher(SessionCache(store))
+        futures = [dispatcher.submit(args.athlete_id, path) for path in args.paths]
+        for path, future in zip(args.paths, futures):
+            try:
+                print(f"{path}: {future.result()}")
+            except Exception as e:
+                print(f"{path}: failed: {e}")
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import glob
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from time import perf_counter
+from PIL import Image
+from thumbnailcache import ThumbnailCache, render_thumbnail
+from treadmilltostrava import get_image_datetime, extract_time_and_distance, convert_time_to_seconds
+
+try:
+    import resource  # Peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+# Offline microbenchmarks for the CPU-side hot paths, run over the sample
+# images in pics/ plus synthetic large images and OCR text. Results are compared
+# with a JSON baseline and the run fails if anything got slower or hungrier than
+# the threshold allows. Baselines are machine specific: record one per machine
+# with --update-baseline before comparing.
+#
+# Memory is the peak RSS growth of one run in a fresh interpreter, because
+# tracemalloc can't see Pillow's pixel buffers. Time is the fastest of several
+# runs, since noise only ever adds time.
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_THRESHOLD = 0.25  # Allowed slowdown / memory growth, as a fraction
+MEMORY_NOISE_BYTES = 1024 * 1024  # Ignore memory changes smaller than this
+TIME_NOISE_SECONDS = 0.0005  # Ignore slowdowns smaller than this
+DISPLAY_SIZE = 500  # Same as the Tkinter display_image
+
+EXIF_IFD = 0x8769
+DATETIME_ORIGINAL = 0x9003
+ORIENTATION = 274
+
+
+def make_large_image(path, size=(6000, 4000), orientation=6):
+    # Noisy photo-sized JPEG with the EXIF tags our code reads
+    image = Image.effect_noise(size, 64).convert('RGB')
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    exif.get_ifd(EXIF_IFD)[DATETIME_ORIGINAL] = "2024:12:19 07:30:00"
+    image.save(path, format='JPEG', quality=90, exif=exif)
+
+
+def make_ocr_text(lines=200_000, seed=0):
+    # Lots of console noise with the readouts right at the end (the slow case for the regexes)
+    rng = random.Random(seed)
+    words = ["SPEED", "INCLINE", "CALORIES", "PULSE", "KM/H", "PROGRAM", "QUICKSTART", "STOP"]
+    noise = "\n".join(f"{rng.choice(words)}{rng.randint(0, 999)}" for _ in range(lines))
+    return noise + "\n45:12\n7.35"
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KB
+
+
+def measure_seconds(func, repeat):
+    func()  # Warm-up
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def measure_peak_rss(name, workdir):
+    # Runs the case once in a child process (see --memory-case) so every case
+    # starts from the same high-water mark
+    if resource is None:
+        return None
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--memory-case', name, '--workdir', workdir],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return int(output.split()[-1])
+
+
+def build_cases(workdir):
+    # name -> (setup, repeat). setup() prepares that case's in-memory fixtures
+    # and returns the function to time, so a --memory-case child only builds
+    # what its own case needs. Files are written once and reused from workdir.
+    cases = {}
+
+    sample_jpegs = sorted(glob.glob(os.path.join('pics', '*.jpg')))
+    large_image = os.path.join(workdir, 'large.jpg')
+    if not os.path.exists(large_image):
+        make_large_image(large_image)
+
+    def datetimes(paths):
+        def run():
+            for path in paths:
+                try:
+                    get_image_datetime(path)
+                except ValueError:
+                    pass
+        return lambda: run
+
+    cases['get_image_datetime[pics]'] = (datetimes(sample_jpegs), 50)
+    cases['get_image_datetime[large]'] = (datetimes([large_image]), 50)
+
+    for path in sample_jpegs + [large_image]:
+        name = os.path.basename(path)
+        cases[f'display_thumbnail[{name}]'] = (lambda path=path: lambda: render_thumbnail(path, DISPLAY_SIZE), 15)
+
+    def cached_thumbnail():
+        cache = ThumbnailCache(os.path.join(workdir, 'thumbcache'))
+        cache.get_bytes(large_image, DISPLAY_SIZE)
+        return lambda: cache.get_image(large_image, DISPLAY_SIZE)
+
+    def ocr_text_parse():
+        ocr_text = make_ocr_text()
+        return lambda: extract_time_and_distance(ocr_text)
+
+    def time_conversion():
+        times = [f"{minutes:02d}:{seconds:02d}" for minutes in range(100) for seconds in range(60)]
+        return lambda: [convert_time_to_seconds(t) for t in times]
+
+    cases['display_thumbnail_cached[large.jpg]'] = (cached_thumbnail, 50)
+    cases['extract_time_and_distance[large text]'] = (ocr_text_parse, 30)
+    cases['convert_time_to_seconds[6000]'] = (time_conversion, 50)
+    return cases
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, noise in (('seconds', TIME_NOISE_SECONDS), ('peak_rss_bytes', MEMORY_NOISE_BYTES)):
+            old, new = baseline[name].get(metric), result[metric]
+            if old is None or new is None:
+                continue
+            # Relative threshold, but never tighter than the noise floor. A zero
+            # baseline (the case didn't raise peak RSS) still fails past the floor.
+            if new > max(old * (1 + threshold), old + noise):
+                growth = f"+{new / old - 1:.0%}" if old else f"+{new - old:.6g}"
+                regressions.append(f"{name}: {metric} {old:.6g} -> {new:.6g} ({growth})")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for local hot paths")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help="Record these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--memory-case', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.memory_case:
+        # Child process for measure_peak_rss: print how far one run raises peak RSS
+        setup, _ = build_cases(args.workdir)[args.memory_case]
+        func = setup()
+        before = peak_rss_bytes()
+        func()
+        print(peak_rss_bytes() - before)
+        sys.exit(0)
+
+    workdir = tempfile.mkdtemp(prefix='treadmill-bench-')
+    try:
+        results = {}
+        for name, (setup, repeat) in build_cases(workdir).items():
+            func = setup()
+            results[name] = {"seconds": measure_seconds(func, repeat), "peak_rss_bytes": measure_peak_rss(name, workdir)}
+            peak = results[name]['peak_rss_bytes']
+            memory = f"peak RSS +{peak / 1024:.0f} KB" if peak is not None else "peak RSS not available"
+            print(f"{name}: {results[name]['seconds'] * 1000:.2f} ms, {memory}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    with open(args.baseline, 'r') as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.threshold)
+    if regressions:
+        print("Regressions beyond the threshold:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions.")
@@ -0,0 +1,238 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from PIL import Image
+from duplicates import dhash, hamming
+from imagepool import preprocess_image
+from treadmilltostrava import detect_text_annotations, extract_time_and_distance
+
+# Treadmill console profiles. After a full-frame OCR we remember where the time
+# and distance readouts sat on that console (as fractions of the frame) next to
+# the frame's perceptual hash. Later photos of a console we recognise are
+# cropped to just those panels before OCR, and the words are read by position.
+
+DEFAULT_PROFILES_PATH = os.getenv('CONSOLE_PROFILES_PATH', 'console_profiles.json')
+MATCH_DISTANCE = 12  # Max dHash distance, in bits, to treat two frames as the same console
+PADDING = 0.04  # Extra margin around the learned panels, as a fraction of the frame
+# A miss costs two OCR calls (crop, then full frame), so stop cropping for a
+# profile whose match rate falls below MIN_MATCH_RATE after MIN_ATTEMPTS crops.
+# Every PROBE_EVERY full-frame calls it gets one more try, in case it was relearned.
+MIN_MATCH_RATE = 0.5
+MIN_ATTEMPTS = 5
+PROBE_EVERY = 20
+
+
+def annotation_box(annotation, width, height):
+    # Vision pixel vertices -> (left, top, right, bottom) fractions of the frame
+    xs = [vertex.x for vertex in annotation.bounding_poly.vertices]
+    ys = [vertex.y for vertex in annotation.bounding_poly.vertices]
+    return [min(xs) / width, min(ys) / height, max(xs) / width, max(ys) / height]
+
+
+def union_box(*boxes):
+    return [
+        min(box[0] for box in boxes), min(box[1] for box in boxes),
+        max(box[2] for box in boxes), max(box[3] for box in boxes),
+    ]
+
+
+def pad_box(box):
+    return [max(0.0, box[0] - PADDING), max(0.0, box[1] - PADDING),
+            min(1.0, box[2] + PADDING), min(1.0, box[3] + PADDING)]
+
+
+def box_contains(box, x, y):
+    return box[0] <= x <= box[2] and box[1] <= y <= box[3]
+
+
+def find_readouts(words, width, height):
+    # Boxes of the first words that look like a time and a distance
+    time_box = distance_box = None
+    for word in words:
+        time_value, distance = extract_time_and_distance(word.description)
+        if time_box is None and time_value != 'Time not found':
+            time_box = annotation_box(word, width, height)
+        elif distance_box is None and distance != 'Distance not found':
+            distance_box = annotation_box(word, width, height)
+    return time_box, distance_box
+
+
+class ConsoleProfile:
+    def __init__(self, profile_id, frame_hash, time_box, distance_box, hits=0, misses=0,
+                 crop_bytes=0, full_bytes=0, crop_seconds=0.0, full_seconds=0.0, full_calls=0):
+        self.profile_id = profile_id
+        self.frame_hash = frame_hash
+        self.time_box = time_box
+        self.distance_box = distance_box
+        self.hits = hits
+        self.misses = misses
+        self.crop_bytes = crop_bytes
+        self.full_bytes = full_bytes
+        self.crop_seconds = crop_seconds
+        self.full_seconds = full_seconds
+        self.full_calls = full_calls
+
+    @property
+    def match_rate(self):
+        attempts = self.hits + self.misses
+        return self.hits / attempts if attempts else 0.0
+
+    def should_crop(self):
+        if self.hits + self.misses < MIN_ATTEMPTS or self.match_rate >= MIN_MATCH_RATE:
+            return True
+        return self.full_calls % PROBE_EVERY == 0
+
+    def crop_box(self):
+        return pad_box(union_box(self.time_box, self.distance_box))
+
+    def to_dict(self):
+        data = dict(vars(self))
+        data['frame_hash'] = f"{self.frame_hash:016x}"
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data['frame_hash'] = int(data['frame_hash'], 16)
+        return cls(**data)
+
+    def summary(self):
+        attempts = self.hits + self.misses
+        avg_crop = self.crop_bytes / attempts if attempts else 0
+        avg_full = self.full_bytes / self.full_calls if self.full_calls else 0
+        crop_latency = self.crop_seconds / attempts if attempts else 0
+        full_latency = self.full_seconds / self.full_calls if self.full_calls else 0
+        return (f"{self.profile_id}: {self.match_rate:.0%} match rate ({self.hits}/{attempts}), "
+                f"avg crop {avg_crop / 1024:.0f} KB in {crop_latency:.2f}s "
+                f"vs full {avg_full / 1024:.0f} KB in {full_latency:.2f}s ({self.full_calls} full-frame calls)")
+
+
+class ProfileRegistry:
+    def __init__(self, path=DEFAULT_PROFILES_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.profiles = []
+        if os.path.exists(path):
+            with open(path, 'r') as profiles_file:
+                self.profiles = [ConsoleProfile.from_dict(data) for data in json.load(profiles_file)]
+
+    def save(self):
+        # Called once at the end of a run; the lock keeps the snapshot and the write together
+        with self.lock:
+            data = [profile.to_dict() for profile in self.profiles]
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+            with os.fdopen(fd, 'w') as tmp_file:
+                json.dump(data, tmp_file, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def match(self, frame_hash):
+        with self.lock:
+            candidates = [(hamming(frame_hash, profile.frame_hash), profile) for profile in self.profiles]
+        candidates = [candidate for candidate in candidates if candidate[0] <= MATCH_DISTANCE]
+        return min(candidates, key=lambda candidate: candidate[0])[1] if candidates else None
+
+    def learn(self, profile, frame_hash, time_box, distance_box):
+        with self.lock:
+            if profile is None:
+                profile = ConsoleProfile(f"console-{len(self.profiles) + 1}", frame_hash, time_box, distance_box)
+                self.profiles.append(profile)
+            else:
+                # The panels moved (different angle or zoom), so follow the newest layout
+                profile.time_box = time_box
+                profile.distance_box = distance_box
+        return profile
+
+    def extract_text(self, content):
+        # Drop-in for extract_text_from_bytes on a preprocessed JPEG
+        image = Image.open(io.BytesIO(content))
+        image.load()
+        frame_hash = dhash(io.BytesIO(content))
+        profile = self.match(frame_hash)
+
+        with self.lock:
+            crop = profile is not None and profile.should_crop()
+        if crop:
+            text = self._extract_cropped(profile, image)
+            if text is not None:
+                return text
+
+        start = time.perf_counter()
+        annotations = detect_text_annotations(content)
+        elapsed = time.perf_counter() - start
+        if not annotations:
+            return 'No text found'
+
+        time_box, distance_box = find_readouts(annotations[1:], image.width, image.height)
+        if time_box and distance_box:
+            profile = self.learn(profile, frame_hash, time_box, distance_box)
+        if profile is not None:
+            with self.lock:
+                profile.full_bytes += len(content)
+                profile.full_seconds += elapsed
+                profile.full_calls += 1
+        return annotations[0].description.replace(" ", "")
+
+    def _extract_cropped(self, profile, image):
+        left, top, right, bottom = profile.crop_box()
+        crop_pixels = (int(left * image.width), int(top * image.height),
+                       int(right * image.width), int(bottom * image.height))
+        buffer = io.BytesIO()
+        image.crop(crop_pixels).convert('RGB').save(buffer, format='JPEG', quality=90)
+        crop_content = buffer.getvalue()
+
+        start = time.perf_counter()
+        annotations = detect_text_annotations(crop_content)
+        elapsed = time.perf_counter() - start
+
+        # Read each word by where its centre falls on the known layout
+        crop_width = crop_pixels[2] - crop_pixels[0]
+        crop_height = crop_pixels[3] - crop_pixels[1]
+        time_box, distance_box = pad_box(profile.time_box), pad_box(profile.distance_box)
+        time_words, distance_words = [], []
+        for word in annotations[1:]:
+            box = annotation_box(word, crop_width, crop_height)
+            x = left + (box[0] + box[2]) / 2 * (right - left)
+            y = top + (box[1] + box[3]) / 2 * (bottom - top)
+            if box_contains(time_box, x, y):
+                time_words.append(word.description)
+            elif box_contains(distance_box, x, y):
+                distance_words.append(word.description)
+        time_value, _ = extract_time_and_distance("\n".join(time_words))
+        _, distance = extract_time_and_distance("\n".join(distance_words))
+
+        with self.lock:
+            profile.crop_bytes += len(crop_content)
+            profile.crop_seconds += elapsed
+            if time_value != 'Time not found' and distance != 'Distance not found':
+                profile.hits += 1
+                hit = True
+            else:
+                profile.misses += 1
+                hit = False
+        if not hit:
+            return None
+        return f"{time_value}\n{distance}"
+
+    def report(self):
+        with self.lock:
+            return "\n".join(profile.summary() for profile in self.profiles)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OCR photos using learned console profiles")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--profiles', default=DEFAULT_PROFILES_PATH)
+    args = parser.parse_args()
+
+    registry = ProfileRegistry(args.profiles)
+    for path in args.paths:
+        text = registry.extract_text(preprocess_image(path)['content'])
+        time_value, distance = extract_time_and_distance(text)
+        print(f'{path}: Time: {time_value}, Distance: {distance}')
+    registry.save()
+    print(registry.report(), file=sys.stderr)
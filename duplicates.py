@@ -0,0 +1,223 @@
+import os
+import sys
+import argparse
+from datetime import datetime
+import numpy as np
+from PIL import Image
+from imagepool import ImagePool
+from thumbnailcache import apply_exif_orientation
+from treadmilltostrava import get_image_datetime
+
+# Near-duplicate detection for burst shots of the same treadmill screen.
+# Each photo gets a 64-bit dHash; photos taken within a short time window whose
+# hashes are close in Hamming distance form a group, and only the sharpest photo
+# of each group goes on to OCR.
+
+DEFAULT_MAX_DISTANCE = 6  # Bits out of 64
+DEFAULT_WINDOW_SECONDS = 120
+SHARPNESS_SIZE = (512, 384)
+
+
+def load_gray(image_path, size):
+    # Small grayscale array of the oriented image (path or file object);
+    # draft keeps the JPEG decode cheap
+    with Image.open(image_path) as image:
+        image.draft('L', size)
+        image = apply_exif_orientation(image)
+        image = image.convert('L').resize(size, Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32)
+
+
+def hash_pixels(pixels):
+    # Difference hash: compare each pixel with its right neighbour on a 9x8 image
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).tobytes().hex(), 16)
+
+
+def dhash(image_path):
+    return hash_pixels(load_gray(image_path, (9, 8)))
+
+
+def laplacian_variance(pixels):
+    # Variance of the 4-neighbour Laplacian of a grayscale array, higher means sharper
+    pixels = np.asarray(pixels, dtype=np.float32)
+    laplacian = (
+        pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+        - 4 * pixels[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def sharpness(image_path, size=SHARPNESS_SIZE):
+    return laplacian_variance(load_gray(image_path, size))
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    # Metric tree over Hamming distance for fast "everything within d bits" queries
+    def __init__(self):
+        self.root = None
+
+    def add(self, key, item):
+        node = (key, item, {})
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(key, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def query(self, key, max_distance):
+        if self.root is None:
+            return []
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_key, item, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= max_distance:
+                matches.append((distance, item))
+            # Triangle inequality: only these subtrees can hold a match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return matches
+
+
+class DedupeStats:
+    def __init__(self):
+        self.images = 0
+        self.groups = 0
+
+    @property
+    def ocr_calls_saved(self):
+        return self.images - self.groups
+
+    def __str__(self):
+        return f"{self.images} images in {self.groups} groups, {self.ocr_calls_saved} OCR calls saved"
+
+
+def photo_timestamp(image_path):
+    # EXIF capture time when available, otherwise the file's mtime
+    try:
+        return datetime.strptime(get_image_datetime(image_path), "%Y:%m:%d %H:%M:%S").timestamp()
+    except (ValueError, OSError, AttributeError):
+        return os.path.getmtime(image_path)
+
+
+def fingerprint(image_path):
+    # Capture time, dHash and sharpness from a single decode. Top-level so it
+    # can run in an ImagePool worker process. An unreadable file gets None
+    # instead of raising, so one bad photo can't stop the whole batch.
+    try:
+        with Image.open(image_path) as image:
+            image.draft('L', SHARPNESS_SIZE)
+            image = apply_exif_orientation(image)
+            image = image.convert('L').resize(SHARPNESS_SIZE, Image.BILINEAR)
+        key = hash_pixels(np.asarray(image.resize((9, 8), Image.BILINEAR), dtype=np.float32))
+        score = laplacian_variance(np.asarray(image, dtype=np.float32))
+        return image_path, photo_timestamp(image_path), key, score
+    except Exception:
+        return image_path, None, None, None
+
+
+def select_sharpest(image_paths, max_distance=DEFAULT_MAX_DISTANCE,
+                    window_seconds=DEFAULT_WINDOW_SECONDS, stats=None, map_func=map):
+    # Stream (best_path, group_paths) for each burst. Input is expected to be
+    # roughly chronological, as camera rolls are; a group is closed once the
+    # newest photo seen is more than window_seconds past the group's first shot.
+    # Pass an ImagePool's map as map_func to fingerprint photos in worker processes.
+    stats = stats if stats is not None else DedupeStats()
+    open_groups = []
+    tree = BKTree()
+    latest = None
+
+    def close(group):
+        stats.groups += 1
+        best = max(group['members'], key=lambda member: member[1])
+        return best[0], [path for path, _ in group['members']]
+
+    for image_path, taken_at, key, score in map_func(fingerprint, image_paths):
+        stats.images += 1
+        if key is None:
+            # Unreadable: pass it through on its own so the next stage reports the error
+            stats.groups += 1
+            yield image_path, [image_path]
+            continue
+        latest = taken_at if latest is None else max(latest, taken_at)
+
+        expired = [group for group in open_groups if latest - group['start'] > window_seconds]
+        if expired:
+            open_groups = [group for group in open_groups if latest - group['start'] <= window_seconds]
+            tree = BKTree()
+            for group in open_groups:
+                for group_key in group['hashes']:
+                    tree.add(group_key, group)
+            for group in expired:
+                yield close(group)
+
+        member = (image_path, score)
+        matches = [
+            (distance, group) for distance, group in tree.query(key, max_distance)
+            if abs(taken_at - group['start']) <= window_seconds
+        ]
+        if matches:
+            group = min(matches, key=lambda match: match[0])[1]
+        else:
+            group = {'start': taken_at, 'members': [], 'hashes': []}
+            open_groups.append(group)
+        group['members'].append(member)
+        group['hashes'].append(key)
+        tree.add(key, group)
+
+    for group in open_groups:
+        yield close(group)
+
+
+def check_expired_groups():
+    # Regression check: three different screens 100 s apart. When the first
+    # group expires at C, C must not be matched using B's hash.
+    fingerprints = {
+        'A': (0.0, 0x0000000000000000),
+        'B': (100.0, 0xFFFFFFFF00000000),
+        'C': (200.0, 0xFFFF0000FFFF0000),  # 32 bits away from both A and B
+    }
+
+    def fake_map(func, paths):
+        return ((path, fingerprints[path][0], fingerprints[path][1], 1.0) for path in paths)
+
+    result = list(select_sharpest(['A', 'B', 'C'], map_func=fake_map))
+    expected = [('A', ['A']), ('B', ['B']), ('C', ['C'])]
+    if result != expected:
+        raise AssertionError(f"Expected {expected}, got {result}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Group burst shots and pick the sharpest of each")
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE)
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW_SECONDS)
+    parser.add_argument('--check', action='store_true', help="Run the grouping regression check and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        check_expired_groups()
+        print("Grouping check passed.")
+        sys.exit(0)
+    if not args.paths:
+        parser.error("give at least one image path")
+
+    stats = DedupeStats()
+    with ImagePool() as pool:
+        for best, group in select_sharpest(sorted(args.paths), args.max_distance, args.window, stats, pool.map):
+            skipped = [path for path in group if path != best]
+            print(best + (f"  (skipping {', '.join(skipped)})" if skipped else ""))
+    print(stats, file=sys.stderr)
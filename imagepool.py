@@ -0,0 +1,108 @@
+import os
+import io
+import sys
+import time
+import glob
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image
+from thumbnailcache import apply_exif_orientation
+
+# Process-pool stage for the CPU-bound part of the pipeline: decode, orient,
+# resize and re-encode. Pixel work runs in worker processes so it is not held
+# back by the GIL, and only the compact re-encoded JPEG comes back to the
+# I/O stage (OCR and upload threads).
+
+DEFAULT_MAX_SIZE = 1600  # Long edge sent to Vision, plenty for a treadmill readout
+DEFAULT_QUALITY = 85
+
+
+def preprocess_image(image_path, max_size=DEFAULT_MAX_SIZE, quality=DEFAULT_QUALITY):
+    # Runs inside a worker process, so it must stay a top-level function
+    with Image.open(image_path) as image:
+        image.draft('RGB', (max_size, max_size))
+        image = apply_exif_orientation(image)
+        image.thumbnail((max_size, max_size))
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, format='JPEG', quality=quality)
+    return {
+        "path": image_path,
+        "content": buffer.getvalue(),
+        "width": image.width,
+        "height": image.height,
+    }
+
+
+class ImagePool:
+    def __init__(self, max_workers=None, max_size=DEFAULT_MAX_SIZE, quality=DEFAULT_QUALITY):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_size = max_size
+        self.quality = quality
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, image_path):
+        return self.executor.submit(preprocess_image, image_path, self.max_size, self.quality)
+
+    def imap(self, image_paths):
+        # Yield results as they complete, keeping only a few jobs per worker in
+        # flight so a huge list of paths never turns into a huge list of buffers
+        max_in_flight = self.max_workers * 2
+        pending = set()
+        for image_path in image_paths:
+            pending.add(self.submit(image_path))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+    def map(self, func, items):
+        # Like the built-in map, run in the worker processes. Results come back in
+        # input order, with a few jobs per worker in flight. func must be top-level.
+        pending = deque()
+        for item in items:
+            pending.append(self.executor.submit(func, item))
+            if len(pending) >= self.max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def benchmark(image_paths, max_workers, repeat):
+    # Images per second for every worker count from 1 to max_workers
+    work = image_paths * repeat
+    results = []
+    for workers in range(1, max_workers + 1):
+        with ImagePool(max_workers=workers) as pool:
+            # Warm up the worker processes before timing
+            list(pool.imap(image_paths[:workers]))
+            start = time.perf_counter()
+            count = sum(1 for _ in pool.imap(work))
+            elapsed = time.perf_counter() - start
+        results.append((workers, count / elapsed))
+        print(f"{workers} worker(s): {count / elapsed:.1f} images/s")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the image preprocessing pool")
+    parser.add_argument('paths', nargs='*', help="Images to preprocess (defaults to pics/*.jpg)")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join('pics', '*.jpg')))
+    if not paths:
+        sys.exit("No images to benchmark.")
+    benchmark(paths, args.max_workers, args.repeat)
@@ -0,0 +1,385 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+import http.client
+from types import SimpleNamespace
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import treadmilltostrava
+from ocrclient import FakeVisionClient, ResilientOCR
+
+# Local HTTP ingest service so members can send the photo straight from their phone.
+#   POST /jobs      multipart/form-data with an "image" file, photo or short video (plus optional
+#                   "title" and "description" fields) -> 202 {"job_id": ...}
+#   GET  /jobs/<id> job status, and the parsed result once it's done
+# Upload bodies are streamed to disk in small chunks, never held in memory, and
+# jobs wait in a bounded queue for a pool of worker threads.
+
+DEFAULT_PORT = 8080
+UPLOAD_DIR = os.getenv('INGEST_UPLOAD_DIR', 'uploads')
+CHUNK_SIZE = 64 * 1024
+MAX_FIELD_BYTES = 16 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+MAX_UPLOAD_BYTES = 30 * 1024 * 1024
+MAX_QUEUED_JOBS = 200
+MAX_FINISHED_JOBS = 1000  # Finished jobs kept around for polling
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class MultipartReader:
+    # Minimal streaming multipart/form-data reader: file parts go straight to
+    # disk, small text fields are kept in memory
+    def __init__(self, rfile, content_length, boundary):
+        self.rfile = rfile
+        self.remaining = content_length
+        self.delimiter = b'--' + boundary
+        self.buf = bytearray()
+
+    def _fill(self):
+        if self.remaining <= 0:
+            return False
+        chunk = self.rfile.read(min(CHUNK_SIZE, self.remaining))
+        if not chunk:
+            self.remaining = 0
+            return False
+        self.remaining -= len(chunk)
+        self.buf += chunk
+        return True
+
+    def _read_until(self, marker, sink, limit=None):
+        # Pass everything before `marker` to sink, consume the marker itself.
+        # Up to len(marker) - 1 bytes are held back in case the marker is split
+        # across two reads.
+        written = 0
+        while True:
+            index = self.buf.find(marker)
+            if index >= 0:
+                sink(bytes(self.buf[:index]))
+                del self.buf[:index + len(marker)]
+                return written + index
+            safe = len(self.buf) - len(marker) + 1
+            if safe > 0:
+                sink(bytes(self.buf[:safe]))
+                del self.buf[:safe]
+                written += safe
+            if limit is not None and written > limit:
+                raise ValueError("Part is too large.")
+            if not self._fill():
+                raise ValueError("Upload ended unexpectedly.")
+
+    def _need(self, size):
+        while len(self.buf) < size:
+            if not self._fill():
+                raise ValueError("Upload ended unexpectedly.")
+
+    def parse(self, open_file):
+        # open_file(filename) returns a writable file for each file part
+        fields = {}
+        files = []
+        self._read_until(self.delimiter, lambda data: None)
+        while True:
+            self._need(2)
+            if self.buf[:2] == b'--':
+                break  # Closing delimiter
+            del self.buf[:2]  # CRLF after the delimiter
+
+            header_data = []
+            self._read_until(b'\r\n\r\n', header_data.append, MAX_HEADER_BYTES)
+            headers = b''.join(header_data).decode('utf-8', 'replace')
+            disposition = re.search(r'content-disposition:([^\r\n]*)', headers, re.IGNORECASE)
+            params = dict(re.findall(r'(\w+)="([^"]*)"', disposition.group(1))) if disposition else {}
+            name = params.get('name', '')
+
+            separator = b'\r\n' + self.delimiter
+            if 'filename' in params:
+                with open_file(params['filename']) as part_file:
+                    size = self._read_until(separator, part_file.write, MAX_UPLOAD_BYTES)
+                files.append((name, part_file.name, size))
+            else:
+                value = []
+                self._read_until(separator, value.append, MAX_FIELD_BYTES)
+                fields[name] = b''.join(value).decode('utf-8', 'replace')
+
+        # Drain the epilogue so the connection can be reused
+        while self._fill():
+            self.buf.clear()
+        return fields, files
+
+
+class JobStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+
+    def create(self, job_id):
+        with self.lock:
+            self.jobs[job_id] = {"job_id": job_id, "status": "receiving", "created": time.time()}
+
+    def update(self, job_id, **changes):
+        with self.lock:
+            self.jobs[job_id].update(changes)
+            if changes.get("status") in ("done", "failed"):
+                self._trim()
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+
+class IngestService:
+    def __init__(self, workers=4, upload_dir=UPLOAD_DIR, dry_run=False, keep_uploads=False):
+        self.upload_dir = upload_dir
+        self.dry_run = dry_run
+        self.keep_uploads = keep_uploads
+        self.jobs = JobStore()
+        self.queue = queue.Queue(maxsize=MAX_QUEUED_JOBS)
+        os.makedirs(upload_dir, exist_ok=True)
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def _work(self):
+        while True:
+            job_id, path, fields = self.queue.get()
+            self.jobs.update(job_id, status="processing")
+            try:
+                options = {key: fields[key] for key in ('title', 'description') if fields.get(key)}
+                result = treadmilltostrava.process_image(path, self.dry_run, **options)
+                status = "failed" if "error" in result else "done"
+                result.pop("path", None)
+                self.jobs.update(job_id, status=status, result=result, finished=time.time())
+            finally:
+                if not self.keep_uploads:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def submit(self, job_id, path, fields):
+        # False when the queue is full, so the caller can ask the client to retry
+        self.jobs.update(job_id, status="queued")
+        try:
+            self.queue.put_nowait((job_id, path, fields))
+        except queue.Full:
+            return False
+        return True
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    service = None
+    quiet = False
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')  # Tell keep-alive clients to reconnect
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {"status": "ok", "queued": self.service.queue.qsize()})
+            return
+        match = re.fullmatch(r'/jobs/([0-9a-f]{32})', self.path)
+        job = self.service.jobs.get(match.group(1)) if match else None
+        if job is None:
+            self._send_json(404, {"error": "Job not found."})
+        else:
+            self._send_json(200, job)
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            # The body is never read, so the connection can't be reused for another request
+            self.close_connection = True
+            self._send_json(404, {"error": "Not found."})
+            return
+        boundary = re.search(r'boundary="?([^";]+)"?', self.headers.get('Content-Type', ''))
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if not boundary or content_length <= 0:
+            self.close_connection = True
+            self._send_json(400, {"error": "Expected a multipart/form-data upload with Content-Length."})
+            return
+        if content_length > MAX_UPLOAD_BYTES + MAX_FIELD_BYTES * 4:
+            self.close_connection = True
+            self._send_json(413, {"error": "Upload is too large."})
+            return
+
+        service = self.service
+        job_id = uuid.uuid4().hex
+        service.jobs.create(job_id)
+        saved = []
+
+        def open_file(filename):
+            extension = os.path.splitext(filename)[1].lower()
+            if extension not in IMAGE_EXTENSIONS + treadmilltostrava.VIDEO_EXTENSIONS:
+                extension = '.jpg'
+            path = os.path.join(service.upload_dir, f"{job_id}-{len(saved)}{extension}")
+            part_file = open(path, 'wb')
+            saved.append(path)
+            return part_file
+
+        try:
+            fields, files = MultipartReader(self.rfile, content_length, boundary.group(1).encode()).parse(open_file)
+        except (ValueError, OSError) as e:
+            # A malformed upload (ValueError) or a failure to save it, e.g. a full disk (OSError)
+            for path in saved:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            service.jobs.update(job_id, status="failed", result={"error": str(e)})
+            self.close_connection = True
+            if isinstance(e, ValueError):
+                self._send_json(400, {"error": str(e)})
+            else:
+                self._send_json(500, {"error": "Could not save the upload."})
+            return
+
+        image = next((path for name, path, _ in files if name == 'image'), None)
+        for path in saved:
+            if path != image:
+                os.remove(path)
+        if image is None:
+            service.jobs.update(job_id, status="failed", result={"error": "No image field."})
+            self._send_json(400, {"error": "Expected a file in the \"image\" field."})
+            return
+        if not service.submit(job_id, image, fields):
+            os.remove(image)
+            service.jobs.update(job_id, status="failed", result={"error": "Server busy."})
+            self._send_json(503, {"error": "Too many queued jobs, try again shortly."})
+            return
+        self._send_json(202, {"job_id": job_id, "status_url": f"/jobs/{job_id}"})
+
+
+class IngestServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Room for bursts of phones connecting at once
+
+
+def serve(host='0.0.0.0', port=DEFAULT_PORT, quiet=False, **service_options):
+    handler = type('Handler', (IngestHandler,), {'service': IngestService(**service_options), 'quiet': quiet})
+    return IngestServer((host, port), handler)
+
+
+def use_stand_ins(ocr_latency=0.3, upload_latency=0.2):
+    # Swap Vision and Strava for local fakes with realistic latency
+    treadmilltostrava.default_ocr = ResilientOCR(client=FakeVisionClient(latency=ocr_latency))
+    counter = iter(range(1, sys.maxsize))
+
+    def fake_upload(time_value, distance, image_path, *args, **kwargs):
+        time.sleep(upload_latency)
+        activity_id = next(counter)
+        return SimpleNamespace(status_code=201, json=lambda: {"id": activity_id})
+
+    treadmilltostrava.upload_activity_to_strava = fake_upload
+
+
+def _post_image(host, port, image_bytes):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="photo.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + image_bytes + f'\r\n--{boundary}--\r\n'.encode()
+    connection = http.client.HTTPConnection(host, port)
+    connection.request('POST', '/jobs', body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    connection.close()
+    return response.status, data
+
+
+def _wait_for_job(host, port, job_id):
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        while True:
+            connection.request('GET', f'/jobs/{job_id}')
+            job = json.loads(connection.getresponse().read())
+            if job.get("status") in ("done", "failed"):
+                return job
+            time.sleep(0.05)
+    finally:
+        connection.close()
+
+
+def benchmark(image_path, uploads, concurrency, workers):
+    # Throughput and latency against the local Vision and Strava stand-ins
+    use_stand_ins()
+    server = serve('127.0.0.1', 0, quiet=True, workers=workers, dry_run=False)
+    host, port = server.server_address
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with open(image_path, 'rb') as image_file:
+        image_bytes = image_file.read()
+
+    def one_upload(_):
+        start = time.perf_counter()
+        status, data = _post_image(host, port, image_bytes)
+        accepted = time.perf_counter() - start
+        if status != 202:
+            return accepted, None, status
+        job = _wait_for_job(host, port, data["job_id"])
+        return accepted, time.perf_counter() - start, job["status"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_upload, range(uploads)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    accepted = sorted(result[0] for result in results)
+    finished = sorted(result[1] for result in results if result[1] is not None)
+
+    def percentile(values, q):
+        return values[min(len(values) - 1, int(len(values) * q))] if values else float('nan')
+
+    print(f"{uploads} uploads, {concurrency} concurrent clients, {workers} workers: "
+          f"{len(finished) / elapsed:.1f} jobs/s")
+    print(f"  accept latency p50 {percentile(accepted, 0.5) * 1000:.0f} ms, p95 {percentile(accepted, 0.95) * 1000:.0f} ms")
+    print(f"  end-to-end latency p50 {percentile(finished, 0.5):.2f} s, p95 {percentile(finished, 0.95):.2f} s")
+    rejected = sum(1 for result in results if result[1] is None)
+    if rejected:
+        print(f"  {rejected} uploads rejected")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local HTTP ingest service for treadmill photos")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--dry-run', action='store_true', help="Parse but do not upload to Strava")
+    parser.add_argument('--keep-uploads', action='store_true', help="Keep uploaded photos after processing")
+    parser.add_argument('--fake', action='store_true', help="Use local Vision and Strava stand-ins")
+    parser.add_argument('--bench', type=int, metavar='N', help="Benchmark N uploads against the stand-ins and exit")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--bench-image', default=os.path.join('pics', 'treadmill3.jpg'))
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.bench_image, args.bench, args.concurrency, args.workers)
+        sys.exit(0)
+
+    if args.fake:
+        use_stand_ins()
+    server = serve(args.host, args.port, workers=args.workers, dry_run=args.dry_run, keep_uploads=args.keep_uploads)
+    print(f"Listening on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
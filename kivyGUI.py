@@ -1,7 +1,10 @@
 import os
 import re
+import sys
+import argparse
 import webbrowser
 import threading
+from collections import deque
 from datetime import datetime
 from PIL import Image, ImageTk
 from kivy.app import App
@@ -19,13 +22,15 @@ from kivy.uix.filechooser import FileChooserIconView
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.switch import Switch
 from kivy.clock import Clock
-from google.cloud import vision
+from ocrclient import default_ocr
 import io
 from io import BytesIO
 import requests
 from dotenv import load_dotenv
 from requests_oauthlib import OAuth2Session
 from PIL.ExifTags import TAGS
+from thumbnailcache import ThumbnailCache
+import profiling
 
 
 # Load environment variables
@@ -38,6 +43,8 @@ STRAVA_API_URL = "https://www.strava.com/api/v3"
 STRAVA_AUTH_URL = "https://www.strava.com/oauth/authorize"
 STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
 
+thumbnail_cache = ThumbnailCache()
+
 
 def refresh_access_token():
     global access_token
@@ -134,12 +141,10 @@ def get_image_datetime(image_path):
 
 
 def extract_text_from_image(image_path):
-    client = vision.ImageAnnotatorClient()
     with io.open(image_path, 'rb') as image_file:
         content = image_file.read()
-    image = vision.Image(content=content)
-    response = client.text_detection(image=image)
-    texts = response.text_annotations
+    # Shared client with deadlines, hedging and a circuit breaker
+    texts = default_ocr.text_detection(content)
     if texts:
         return texts[0].description.replace(" ", "")
     else:
@@ -203,6 +208,9 @@ def convert_time_to_seconds(time):
     minutes, seconds = time.split(':')
     return int(minutes) * 60 + int(seconds)
 
+# Number of recent results shown under the form; older ones drop off
+HISTORY_SIZE = 10
+
 #Window.size = (800, 900)
 class StravaApp(App):
     def build(self):
@@ -236,9 +244,43 @@ class StravaApp(App):
         self.select_button.pos_hint = {'center_x': 0.5}
         self.upload_button.pos_hint = {'center_x': 0.5}
         
+        self.processing_label = Label(text="Processing...", size_hint_y=None, height=40, color=(0, 0, 1, 1))
+        self.build_form()
+        self.build_history()
 
         return self.root
 
+    def build_form(self):
+        # The form is built once and reused for every image, so a long-running
+        # kiosk session doesn't keep adding widgets
+        self.form_layout = BoxLayout(orientation='vertical', size_hint=(None, None), width=400, padding=10, spacing=50)
+        self.form_layout.pos_hint = {'center_x': 0.5}
+
+        self.title_input = TextInput(multiline=False, size_hint=(None,None), height=40, width=250)
+        self.description_input = TextInput(multiline=False, size_hint=(None,None), height=40, width=250)
+        self.time_input = TextInput(multiline=False, size_hint=(None,None), height=40, width=90)
+        self.distance_input = TextInput(multiline=False, size_hint=(None,None), height=40, width=70)
+
+        for label, text_input in (("Title:", self.title_input), ("Description:", self.description_input),
+                                  ("Time:", self.time_input), ("Distance:", self.distance_input)):
+            row = BoxLayout(orientation='horizontal')
+            row.add_widget(Label(text=label, size_hint=(None,None), height=40, width=90))
+            row.add_widget(text_input)
+            self.form_layout.add_widget(row)
+
+    def build_history(self):
+        # Fixed pool of labels showing the last HISTORY_SIZE results
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.history_layout = BoxLayout(orientation='vertical', size_hint_y=None, height=30 * HISTORY_SIZE)
+        self.history_labels = [Label(text="", size_hint_y=None, height=30) for _ in range(HISTORY_SIZE)]
+        for label in self.history_labels:
+            self.history_layout.add_widget(label)
+
+    def add_history(self, entry):
+        self.history.appendleft(entry)
+        for label, text in zip(self.history_labels, list(self.history) + [""] * HISTORY_SIZE):
+            label.text = text
+
     def select_image(self, instance):
         file_chooser = FileChooserIconView()
         
@@ -252,27 +294,10 @@ class StravaApp(App):
         if selected_file:
             self.image_path = selected_file[0]
             self.image_label.text = ""
-            img = Image.open(self.image_path)
-            try:
-                exif = img._getexif()
-                if exif is not None:
-                    orientation_tag = 274
-                    if orientation_tag in exif:
-                        orientation = exif[orientation_tag]
-                        if orientation == 3:
-                            img = img.rotate(180, expand=True)
-                        elif orientation == 6:
-                            img = img.rotate(270, expand=True)
-                        elif orientation == 8:
-                            img = img.rotate(90, expand=True)
-            except (AttributeError, KeyError, IndexError):
-                pass
+            # Load the oriented, resized thumbnail from the shared cache
+            img_byte_arr = BytesIO(thumbnail_cache.get_bytes(self.image_path, 1024))
             
-            img_byte_arr = BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
-            
-            image = CoreImage(img_byte_arr, ext='png')
+            image = CoreImage(img_byte_arr, ext='jpg')
             self.displayed_image.texture = image.texture
             popup.dismiss()
             
@@ -298,64 +323,28 @@ class StravaApp(App):
             Clock.schedule_once(lambda dt: self.hide_processing_message())
             
     def show_processing_message(self):
-        self.processing_label = Label(text="Processing...", size_hint_y=None, height=40, color=(0, 0, 1, 1))
-        self.root.add_widget(self.processing_label)
+        if self.processing_label.parent is None:
+            self.root.add_widget(self.processing_label)
     
     def hide_processing_message(self):
-        if hasattr(self, 'processing_label'):
+        if self.processing_label.parent is not None:
             self.root.remove_widget(self.processing_label)
 
     def update_ui_with_time_and_distance(self, time, distance,title,description):
+        self.title_input.text = f"{title}"
+        self.description_input.text = f"{description}"
+        self.time_input.text = f"{time}"
+        self.distance_input.text = f"{distance}"
         
-        main_layout = BoxLayout(orientation='vertical', size_hint=(None, None), width=400, padding=10, spacing=50)
-        
-        title_layout = BoxLayout(orientation='horizontal')
-        description_layout = BoxLayout(orientation='horizontal')
-        time_layout = BoxLayout(orientation='horizontal')
-        distance_layout = BoxLayout(orientation='horizontal')
-        
-        if not hasattr(self, 'title_input'):
-            title_layout.add_widget(Label(text="Title:", size_hint=(None,None), height=40, width=90))
-            self.title_input = TextInput(text=f"{title}", multiline=False, size_hint=(None,None), height=40, width=250)
-            title_layout.add_widget(self.title_input)
-        else:
-            self.title_input.text = f"{title}"
-        if not hasattr(self, 'description_input'):
-            description_layout.add_widget(Label(text="Description:", size_hint=(None,None), height=40, width=90))
-            self.description_input = TextInput(text=f"{description}", multiline=False, size_hint=(None,None), height=40, width=250)
-            description_layout.add_widget(self.description_input)
-        else:
-            self.description_input.text = f"{description}"
-        if not hasattr(self, 'time_input'):
-            time_layout.add_widget(Label(text="Time:", size_hint=(None,None), height=40, width=90))
-            self.time_input = TextInput(text=f"{time}", multiline=False, size_hint=(None,None), height=40, width=90)
-            time_layout.add_widget(self.time_input)
-        else:
-            self.time_input.text = f"{time}"
-        if not hasattr(self, 'distance_input'):
-            distance_layout.add_widget(Label(text="Distance:", size_hint=(None,None), height=40, width=90))
-            self.distance_input = TextInput(text=f"{distance}", multiline=False, size_hint=(None,None), height=40, width=70)
-            distance_layout.add_widget(self.distance_input)
-        else:
-            self.distance_input.text = f"{distance}"
-        
-        # # Center the inputs horizontally within the BoxLayout
-        # self.time_input.pos_hint = {'center_x': 0.5}  
-        # self.distance_input.pos_hint = {'center_x': 0.5} 
-        # self.title_input.pos_hint = {'center_x': 0.5}
-        # self.description_input.pos_hint = {'center_x': 0.5}
+        # Show the form and history the first time a result comes in
+        if self.form_layout.parent is None:
+            self.scroll_layout.add_widget(self.form_layout)
+            self.scroll_layout.add_widget(self.history_layout)
+        self.add_history(f"{os.path.basename(self.image_path)}: {time}, {distance}")
         
         # Enable the upload button
         self.upload_button.disabled = False
         
-        main_layout.add_widget(title_layout)
-        main_layout.add_widget(description_layout)
-        main_layout.add_widget(time_layout)
-        main_layout.add_widget(distance_layout)
-        
-        self.scroll_layout.add_widget(main_layout)
-        main_layout.pos_hint = {'center_x': 0.5}
-        
     def upload_to_strava(self, instance):
         if self.image_path:
             self.upload_button.disabled = True
@@ -368,6 +357,7 @@ class StravaApp(App):
 
                 response = upload_activity_to_strava(time, distance, self.image_path, title, description)
                 if response and response.status_code == 201:
+                    self.add_history(f"{os.path.basename(self.image_path)}: uploaded")
                     self.show_success("Activity uploaded to Strava successfully!")
                 else:
                     self.show_error("Failed to upload to Strava.", response.content)
@@ -391,4 +381,12 @@ class StravaApp(App):
 
 
 if __name__ == "__main__":
+    # Kivy keeps its own options, so pass ours after "--": python kivyGUI.py -- --profile DIR
+    parser = argparse.ArgumentParser(description="Treadmill to Strava (Kivy)")
+    parser.add_argument('--profile', metavar='DIR', help=f"Write cProfile/tracemalloc reports to DIR (or set {profiling.PROFILE_ENV})")
+    args, _ = parser.parse_known_args()
+    profiling.setup(args.profile)
+    profiling.instrument(sys.modules[__name__], ['extract_text_from_image', 'upload_activity_to_strava'])
+    profiling.instrument(StravaApp, ['process_image_thread', 'display_image'])
+
     StravaApp().run()
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+import sys
+import glob
+import argparse
+import tracemalloc
+
+# Soak check for the Kivy GUI as a kiosk: push thousands of images through the
+# display -> OCR -> form update path and check that the widget count and RSS
+# stay flat. Vision is replaced by the local fake client, so it runs offline.
+# Needs a display (use xvfb-run on a headless box).
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from kivy.clock import Clock
+import kivyGUI
+from ocrclient import FakeVisionClient, ResilientOCR
+
+WARMUP = 50
+
+
+class _Popup:
+    def dismiss(self):
+        pass
+
+
+def rss_bytes():
+    # Resident set size from /proc on Linux, traced Python memory elsewhere
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return tracemalloc.get_traced_memory()[0]
+
+
+def widget_count(app):
+    return sum(1 for _ in app.root.walk())
+
+
+def soak(image_paths, count, max_rss_growth):
+    kivyGUI.default_ocr = ResilientOCR(client=FakeVisionClient(latency=0, jitter=0))
+    app = kivyGUI.StravaApp()
+    app.root = app.build()
+    # Run the OCR step inline instead of on a thread so every image is finished before the next
+    app.process_image = app.process_image_thread
+
+    baseline_widgets = baseline_rss = None
+    for i in range(count):
+        path = image_paths[i % len(image_paths)]
+        app.display_image(None, [path], _Popup())
+        Clock.tick()
+        if i + 1 == WARMUP:
+            baseline_widgets, baseline_rss = widget_count(app), rss_bytes()
+        if (i + 1) % 500 == 0:
+            print(f"{i + 1} images: {widget_count(app)} widgets, RSS {rss_bytes() / 1024 / 1024:.1f} MB")
+
+    widgets, rss = widget_count(app), rss_bytes()
+    print(f"After warm-up: {baseline_widgets} widgets, RSS {baseline_rss / 1024 / 1024:.1f} MB")
+    print(f"After {count} images: {widgets} widgets, RSS {rss / 1024 / 1024:.1f} MB")
+    ok = True
+    if widgets != baseline_widgets:
+        print("FAIL: widget count grew")
+        ok = False
+    if rss - baseline_rss > max_rss_growth:
+        print(f"FAIL: RSS grew by {(rss - baseline_rss) / 1024 / 1024:.1f} MB")
+        ok = False
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Soak test the Kivy GUI for widget and memory growth")
+    parser.add_argument('paths', nargs='*', help="Images to cycle through (defaults to pics/*.jpg)")
+    parser.add_argument('--count', type=int, default=3000)
+    parser.add_argument('--max-rss-growth-mb', type=float, default=20)
+    args = parser.parse_args()
+
+    if not os.path.exists('/proc/self/statm'):
+        tracemalloc.start()
+    paths = args.paths or sorted(glob.glob(os.path.join('pics', '*.jpg')))
+    if not paths:
+        sys.exit("No images to soak with.")
+    ok = soak(paths, max(args.count, WARMUP), args.max_rss_growth_mb * 1024 * 1024)
+    sys.exit(0 if ok else 1)
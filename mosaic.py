@@ -0,0 +1,120 @@
+import io
+import sys
+import math
+import argparse
+from PIL import Image
+from imagepool import preprocess_image
+from treadmilltostrava import detect_text_annotations, extract_text_from_bytes, extract_time_and_distance
+
+# Mosaic batching: tile several preprocessed photos onto one canvas, make a single
+# Vision call for the lot, then give each word back to the photo it came from.
+# Treadmill readouts are large digits, so a downscaled tile still reads fine.
+
+DEFAULT_PER_MOSAIC = 4
+DEFAULT_CELL_SIZE = 1024  # Longest edge of each tile
+GUTTER = 32  # Blank space between tiles so words never run across two photos
+
+
+def build_mosaic(contents, cell_size=DEFAULT_CELL_SIZE):
+    # Returns the encoded canvas and each tile's (left, top, width, height)
+    columns = max(1, math.ceil(math.sqrt(len(contents))))
+    rows = (len(contents) + columns - 1) // columns
+    pitch = cell_size + GUTTER
+    canvas = Image.new('RGB', (columns * pitch - GUTTER, rows * pitch - GUTTER), 'white')
+
+    tiles = []
+    for index, content in enumerate(contents):
+        with Image.open(io.BytesIO(content)) as image:
+            image.draft('RGB', (cell_size, cell_size))
+            image = image.convert('RGB')
+            image.thumbnail((cell_size, cell_size))
+            left = (index % columns) * pitch
+            top = (index // columns) * pitch
+            canvas.paste(image, (left, top))
+            tiles.append((left, top, image.width, image.height))
+
+    buffer = io.BytesIO()
+    canvas.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue(), tiles
+
+
+def split_annotations(words, tiles):
+    # Assign each word to the tile holding the centre of its bounding box
+    texts = [[] for _ in tiles]
+    for word in words:
+        xs = [vertex.x for vertex in word.bounding_poly.vertices]
+        ys = [vertex.y for vertex in word.bounding_poly.vertices]
+        x = (min(xs) + max(xs)) / 2
+        y = (min(ys) + max(ys)) / 2
+        for index, (left, top, width, height) in enumerate(tiles):
+            if left <= x <= left + width and top <= y <= top + height:
+                texts[index].append(word.description)
+                break
+    return ["\n".join(words) if words else 'No text found' for words in texts]
+
+
+def extract_texts_from_mosaic(contents, cell_size=DEFAULT_CELL_SIZE):
+    # One Vision call for up to a handful of images, one text per image
+    if len(contents) == 1:
+        return [extract_text_from_bytes(contents[0])]
+    canvas, tiles = build_mosaic(contents, cell_size)
+    annotations = detect_text_annotations(canvas)
+    return split_annotations(annotations[1:], tiles)
+
+
+class MosaicStats:
+    def __init__(self):
+        self.images = 0
+        self.calls = 0
+        self.compared = 0
+        self.agreed = 0
+
+    def __str__(self):
+        calls_per_image = self.calls / self.images if self.images else 0
+        summary = f"{self.images} images in {self.calls} Vision calls ({calls_per_image:.2f} calls per image)"
+        if self.compared:
+            summary += f", {self.agreed}/{self.compared} results match single-image OCR"
+        return summary
+
+
+def extract_batched(image_paths, per_mosaic=DEFAULT_PER_MOSAIC, cell_size=DEFAULT_CELL_SIZE, stats=None):
+    # Stream (path, time, distance), one mosaic's worth of images at a time
+    stats = stats if stats is not None else MosaicStats()
+    batch = []
+
+    def flush():
+        contents = [preprocess_image(path)['content'] for path in batch]
+        texts = extract_texts_from_mosaic(contents, cell_size)
+        stats.images += len(batch)
+        stats.calls += 1
+        results = [(path, *extract_time_and_distance(text)) for path, text in zip(batch, texts)]
+        batch.clear()
+        return results
+
+    for image_path in image_paths:
+        batch.append(image_path)
+        if len(batch) == per_mosaic:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OCR several photos per Vision call")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--per-mosaic', type=int, default=DEFAULT_PER_MOSAIC)
+    parser.add_argument('--cell-size', type=int, default=DEFAULT_CELL_SIZE)
+    parser.add_argument('--compare', action='store_true',
+                        help="Also OCR each photo on its own and report how often the results agree")
+    args = parser.parse_args()
+
+    stats = MosaicStats()
+    for path, time_value, distance in extract_batched(args.paths, args.per_mosaic, args.cell_size, stats):
+        print(f'{path}: Time: {time_value}, Distance: {distance}')
+        if args.compare:
+            single = extract_time_and_distance(extract_text_from_bytes(preprocess_image(path)['content']))
+            stats.compared += 1
+            stats.agreed += single == (time_value, distance)
+            if single != (time_value, distance):
+                print(f'  single-image OCR read Time: {single[0]}, Distance: {single[1]}')
+    print(stats, file=sys.stderr)
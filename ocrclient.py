@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from types import SimpleNamespace
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from google.cloud import vision
+
+# Vision OCR with bounded latency:
+# - every call gets a deadline, so a hung RPC can't stall a GUI or batch worker
+# - if the first request is still running after the recent p95 latency, a
+#   duplicate (hedged) request is sent and whichever answers first wins
+# - a circuit breaker stops calling an unhealthy backend for a while and either
+#   fails fast or switches to a fallback
+
+OCR_DEADLINE = float(os.getenv('OCR_DEADLINE_SECONDS', '15'))
+OCR_HEDGE = os.getenv('OCR_HEDGE', '1') == '1'
+OCR_HEDGE_PERCENTILE = float(os.getenv('OCR_HEDGE_PERCENTILE', '95'))
+OCR_HEDGE_MIN_DELAY = float(os.getenv('OCR_HEDGE_MIN_DELAY_SECONDS', '0.3'))
+OCR_HEDGE_DEFAULT_DELAY = 1.0  # Used until we have enough latency samples
+OCR_BREAKER_FAILURES = int(os.getenv('OCR_BREAKER_FAILURES', '5'))
+OCR_BREAKER_RESET = float(os.getenv('OCR_BREAKER_RESET_SECONDS', '30'))
+
+
+class OCRUnavailableError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # closed: calls go through; open: calls are refused until reset_timeout has
+    # passed; half-open: one trial call decides whether to close or reopen
+    def __init__(self, failure_threshold=OCR_BREAKER_FAILURES, reset_timeout=OCR_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half-open'
+            if self.state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    def __init__(self, size=200, min_samples=20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percent):
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+
+class ResilientOCR:
+    def __init__(self, client=None, deadline=OCR_DEADLINE, hedge=OCR_HEDGE,
+                 hedge_percentile=OCR_HEDGE_PERCENTILE, hedge_min_delay=OCR_HEDGE_MIN_DELAY,
+                 breaker=None, fallback=None, max_workers=8):
+        self._client = client
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        # Called with the image bytes when the breaker is open; None means fail fast
+        self.fallback = fallback
+        self.latencies = LatencyTracker()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    @property
+    def client(self):
+        # One shared client; creating one per call costs a fresh channel each time
+        with self.lock:
+            if self._client is None:
+                self._client = vision.ImageAnnotatorClient()
+            return self._client
+
+    def hedge_delay(self):
+        p = self.latencies.percentile(self.hedge_percentile)
+        return max(self.hedge_min_delay, p if p is not None else OCR_HEDGE_DEFAULT_DELAY)
+
+    def _call(self, content, started=None, end=None):
+        # Runs on the executor; the deadline counts from here, not from submit,
+        # so time spent queued behind other callers isn't blamed on the backend
+        start = time.monotonic()
+        if started is not None:
+            started.set()
+        timeout = self.deadline if end is None else max(0.001, end - start)
+        response = self.client.text_detection(image=vision.Image(content=content), timeout=timeout)
+        if response.error.message:
+            raise OCRUnavailableError(response.error.message)
+        self.latencies.add(time.monotonic() - start)
+        return response.text_annotations
+
+    def text_detection(self, content):
+        # Text annotations for the image, within the deadline or not at all
+        if not self.breaker.allow():
+            if self.fallback is not None:
+                return self.fallback(content)
+            raise OCRUnavailableError("OCR backend is unavailable, try again shortly.")
+
+        started = threading.Event()
+        primary = self.executor.submit(self._call, content, started)
+        started.wait()
+        end = time.monotonic() + self.deadline
+        pending = {primary}
+        hedged = not self.hedge
+        error = None
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            timeout = remaining if hedged else min(remaining, self.hedge_delay())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    annotations = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self.breaker.record_success()
+                if future is not primary:
+                    with self.lock:
+                        self.hedges_won += 1
+                return annotations
+            if not hedged and end - time.monotonic() > 0:
+                # Primary is slow (or already failed): send a duplicate request
+                hedged = True
+                with self.lock:
+                    self.hedges_sent += 1
+                pending.add(self.executor.submit(self._call, content, None, end))
+
+        self.breaker.record_failure()
+        if error is not None and not pending:
+            raise OCRUnavailableError(f"OCR request failed: {error}")
+        raise OCRUnavailableError(f"OCR request timed out after {self.deadline:.1f}s")
+
+
+def _fake_annotations(text):
+    words = []
+    for index, word in enumerate(text.split()):
+        vertices = [SimpleNamespace(x=x, y=100 * index + y) for x, y in ((0, 0), (200, 0), (200, 80), (0, 80))]
+        words.append(SimpleNamespace(description=word, bounding_poly=SimpleNamespace(vertices=vertices)))
+    full = SimpleNamespace(description=text, bounding_poly=SimpleNamespace(vertices=[]))
+    return [full] + words
+
+
+class FakeVisionClient:
+    # Local stand-in for ImageAnnotatorClient with injectable latency and failures
+    def __init__(self, text="25:30\n3.52", latency=0.2, jitter=0.05, slow_rate=0.0, slow_latency=5.0,
+                 failure_rate=0.0, seed=None):
+        self.text = text
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def text_detection(self, image=None, timeout=None):
+        with self.lock:
+            self.calls += 1
+            roll = self.random.random()
+            slow = self.random.random() < self.slow_rate
+            delay = (self.slow_latency if slow else self.latency) + self.random.uniform(0, self.jitter)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Deadline exceeded")
+        time.sleep(delay)
+        if roll < self.failure_rate:
+            raise ConnectionError("Injected failure")
+        return SimpleNamespace(text_annotations=_fake_annotations(self.text), error=SimpleNamespace(message=''))
+
+
+default_ocr = ResilientOCR()
+
+
+if __name__ == '__main__':
+    # Compare tail latency with and without hedging against the fake client
+    parser = argparse.ArgumentParser(description="Exercise ResilientOCR against a local fake")
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--slow-rate', type=float, default=0.03)
+    parser.add_argument('--slow-latency', type=float, default=3.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--deadline', type=float, default=OCR_DEADLINE)
+    args = parser.parse_args()
+
+    for hedge in (False, True):
+        fake = FakeVisionClient(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+                                failure_rate=args.failure_rate, seed=1)
+        ocr = ResilientOCR(client=fake, deadline=args.deadline, hedge=hedge)
+        latencies, failures = [], 0
+        for _ in range(args.calls):
+            start = time.monotonic()
+            try:
+                ocr.text_detection(b'')
+            except OCRUnavailableError:
+                failures += 1
+            latencies.append(time.monotonic() - start)
+        latencies.sort()
+        p50, p95, p99 = (latencies[int(len(latencies) * q)] for q in (0.5, 0.95, 0.99))
+        print(f"hedge={hedge}: p50 {p50:.3f}s, p95 {p95:.3f}s, p99 {p99:.3f}s, "
+              f"{failures} failures, {fake.calls} backend calls, {ocr.hedges_won}/{ocr.hedges_sent} hedges won, "
+              f"breaker {ocr.breaker.state}", file=sys.stderr)
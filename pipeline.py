@@ -0,0 +1,229 @@
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+from imagepool import ImagePool
+from duplicates import DedupeStats, select_sharpest
+from consoleprofiles import ProfileRegistry
+from treadmilltostrava import (
+    get_image_datetime,
+    extract_text_from_bytes,
+    extract_time_and_distance,
+    upload_activity_to_strava,
+)
+
+# Streaming pipeline for large photo sets:
+#   discover -> metadata -> preprocess -> ocr -> parse -> upload
+# Every stage runs in its own threads and hands records to the next one through
+# a bounded queue. A full queue blocks the stage feeding it, so memory stays flat
+# however many photos there are and the slowest stage sets the pace.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+DEFAULT_QUEUE_SIZE = 16
+
+_DONE = object()
+
+
+def discover_images(root):
+    # Lazily walk the tree so we never build a list of every path
+    if os.path.isfile(root):
+        yield root
+        return
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, filename)
+
+
+class Stage:
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.processed = 0
+        self.in_queue = None
+        self.out_queue = None
+        self.next_stage = None
+        self.lock = threading.Lock()
+        self.running = 0
+
+    def start(self):
+        self.running = self.workers
+        for _ in range(self.workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def _work(self):
+        while True:
+            record = self.in_queue.get()
+            if record is _DONE:
+                break
+            if 'error' not in record:
+                try:
+                    record = self.func(record)
+                except Exception as e:
+                    record['error'] = f"{self.name}: {e}"
+            if record is not None:
+                self.out_queue.put(record)
+            with self.lock:
+                self.processed += 1
+
+        # The last worker out tells every worker of the next stage to stop
+        with self.lock:
+            self.running -= 1
+            last = self.running == 0
+        if last:
+            downstream = self.next_stage.workers if self.next_stage else 1
+            for _ in range(downstream):
+                self.out_queue.put(_DONE)
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        for i, stage in enumerate(stages):
+            stage.in_queue = self.queues[i]
+            stage.out_queue = self.queues[i + 1]
+            stage.next_stage = stages[i + 1] if i + 1 < len(stages) else None
+        self.feed_error = None
+
+    def queue_depths(self):
+        # Records waiting in front of each stage, plus finished ones not yet consumed
+        depths = {stage.name: stage.in_queue.qsize() for stage in self.stages}
+        depths['done'] = self.queues[-1].qsize()
+        return depths
+
+    def report(self):
+        return ", ".join(
+            f"{stage.name}: {stage.in_queue.qsize()} queued / {stage.processed} done"
+            for stage in self.stages
+        )
+
+    def _feed(self, records):
+        # The stop markers always go out, even if the records iterator fails,
+        # so run() can finish and re-raise the error
+        try:
+            for record in records:
+                self.queues[0].put(record)
+        except Exception as e:
+            self.feed_error = e
+        finally:
+            for _ in range(self.stages[0].workers):
+                self.queues[0].put(_DONE)
+
+    def run(self, records):
+        # Yield finished records as they come out of the last stage
+        for stage in self.stages:
+            stage.start()
+        threading.Thread(target=self._feed, args=(records,), daemon=True).start()
+        while True:
+            record = self.queues[-1].get()
+            if record is _DONE:
+                break
+            yield record
+        if self.feed_error is not None:
+            raise self.feed_error
+
+
+def build_pipeline(pool, ocr_workers=4, upload_workers=2, dry_run=False, queue_size=DEFAULT_QUEUE_SIZE,
+                   registry=None):
+    # With a console profile registry, known consoles are cropped to their readouts before OCR
+    extract_text = registry.extract_text if registry else extract_text_from_bytes
+
+    def metadata(record):
+        # A photo without a capture date can still be read; only its upload fails
+        try:
+            record['start_date'] = get_image_datetime(record['path'])
+        except ValueError:
+            record['start_date'] = None
+        return record
+
+    def preprocess(record):
+        result = pool.submit(record['path']).result()
+        record['content'] = result['content']
+        return record
+
+    def ocr(record):
+        # Drop the image buffer as soon as OCR is done with it
+        record['text'] = extract_text(record.pop('content'))
+        return record
+
+    def parse(record):
+        record['time'], record['distance'] = extract_time_and_distance(record.pop('text'))
+        if record['time'] == 'Time not found' or record['distance'] == 'Distance not found':
+            record['error'] = "parse: time or distance not found"
+        return record
+
+    def upload(record):
+        if dry_run:
+            return record
+        if record['start_date'] is None:
+            raise ValueError("no capture date in EXIF data")
+        response = upload_activity_to_strava(record['time'], record['distance'], record['path'],
+                                             start_date_local=record['start_date'])
+        record['status_code'] = response.status_code if response is not None else None
+        if record['status_code'] != 201:
+            record['error'] = f"upload: status {record['status_code']}"
+        return record
+
+    stages = [
+        Stage('metadata', metadata, workers=2),
+        Stage('preprocess', preprocess, workers=pool.max_workers),
+        Stage('ocr', ocr, workers=ocr_workers),
+        Stage('parse', parse),
+        Stage('upload', upload, workers=upload_workers),
+    ]
+    return Pipeline(stages, queue_size=queue_size)
+
+
+def _report_periodically(pipeline, interval, stop, dedupe_stats=None):
+    while not stop.wait(interval):
+        # Fingerprinting for dedupe happens before the first queue, so it is reported separately
+        dedupe = f"dedupe: {dedupe_stats.images} fingerprinted, " if dedupe_stats else ""
+        print(f"[queues] {dedupe}{pipeline.report()}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stream a photo archive through OCR and upload")
+    parser.add_argument('root', help="Image file or directory to scan")
+    parser.add_argument('--dry-run', action='store_true', help="Parse but do not upload")
+    parser.add_argument('--ocr-workers', type=int, default=4)
+    parser.add_argument('--upload-workers', type=int, default=2)
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument('--report-interval', type=float, default=5.0, help="Seconds between queue depth reports")
+    parser.add_argument('--dedupe', action='store_true', help="Only OCR the sharpest photo of each burst")
+    parser.add_argument('--profiles', metavar='PATH', help="Learn and use console profiles stored at PATH")
+    args = parser.parse_args()
+
+    with ImagePool() as pool:
+        registry = ProfileRegistry(args.profiles) if args.profiles else None
+        pipeline = build_pipeline(pool, args.ocr_workers, args.upload_workers, args.dry_run, args.queue_size,
+                                  registry)
+        dedupe_stats = DedupeStats()
+        stop = threading.Event()
+        threading.Thread(target=_report_periodically, daemon=True,
+                         args=(pipeline, args.report_interval, stop, dedupe_stats if args.dedupe else None)).start()
+
+        paths = discover_images(args.root)
+        if args.dedupe:
+            # Hashing and sharpness scoring share the process pool with preprocessing
+            paths = (best for best, _ in select_sharpest(paths, stats=dedupe_stats, map_func=pool.map))
+
+        start = time.perf_counter()
+        count = 0
+        for record in pipeline.run({'path': path} for path in paths):
+            count += 1
+            if 'error' in record:
+                print(f"{record['path']}: {record['error']}")
+            else:
+                print(f"{record['path']}: Time: {record['time']}, Distance: {record['distance']}")
+        stop.set()
+        print(f"Processed {count} images in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        if args.dedupe:
+            print(f"Dedupe: {dedupe_stats}", file=sys.stderr)
+        if registry:
+            registry.save()
+            print(registry.report(), file=sys.stderr)
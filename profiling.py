@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+
+# Opt-in profiling for the entry points. Enable with TREADMILL_PROFILE=<dir> or
+# the --profile <dir> flag. Each call to an instrumented function writes to <dir>:
+#   NNNN-<name>.prof       raw cProfile stats (open with pstats or snakeviz)
+#   NNNN-<name>.collapsed  collapsed stacks for flamegraph.pl / speedscope
+#   NNNN-<name>.alloc.txt  top allocation sites during the call (tracemalloc)
+# plus one line per call in summary.txt. Reports are written by a background
+# thread so a profiled GUI handler doesn't stall its UI thread. When profiling
+# is off, instrument() leaves the functions untouched, so there is no overhead.
+
+PROFILE_ENV = 'TREADMILL_PROFILE'
+TOP_ALLOCATIONS = 25
+MIN_STACK_SECONDS = 1e-6  # Call graph edges below this are left out of the collapsed stacks
+
+_report_dir = None
+_counter = 0
+_counter_lock = threading.Lock()
+# cProfile can only run one profiler at a time, so calls made while another
+# instrumented call is being profiled (nested, or on another thread) run as-is
+_profiler_lock = threading.Lock()
+_reports = queue.Queue()
+_writer = None
+
+
+def setup(report_dir=None):
+    # Turn profiling on from the flag or the environment; returns whether it's on
+    report_dir = report_dir or os.getenv(PROFILE_ENV)
+    if report_dir:
+        enable(report_dir)
+    return enabled()
+
+
+def enable(report_dir):
+    global _report_dir, _writer
+    os.makedirs(report_dir, exist_ok=True)
+    _report_dir = report_dir
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(25)
+    if _writer is None:
+        _writer = threading.Thread(target=_write_reports, daemon=True)
+        _writer.start()
+        # Finish any reports still queued when the program exits
+        atexit.register(_reports.join)
+
+
+def enabled():
+    return _report_dir is not None
+
+
+def instrument(owner, names):
+    # Wrap owner.<name> for every name; owner is a module or a class
+    if not enabled():
+        return
+    for name in names:
+        setattr(owner, name, _profiled(name, getattr(owner, name)))
+
+
+def _profiled(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _profiler_lock.acquire(blocking=False):
+            return func(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+                tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                _reports.put((name, profiler, before, tracemalloc.take_snapshot(), elapsed, peak))
+        finally:
+            _profiler_lock.release()
+    return wrapper
+
+
+def _write_reports():
+    while True:
+        report = _reports.get()
+        try:
+            _write_report(*report)
+        except Exception as e:
+            print(f"Failed to write profiling report for {report[0]}: {e}", file=sys.stderr)
+        finally:
+            _reports.task_done()
+
+
+def _write_report(name, profiler, before, after, elapsed, peak):
+    global _counter
+    with _counter_lock:
+        _counter += 1
+        prefix = os.path.join(_report_dir, f"{_counter:04d}-{name}")
+
+    profiler.dump_stats(prefix + '.prof')
+    stats = pstats.Stats(profiler)
+    with open(prefix + '.collapsed', 'w') as collapsed_file:
+        for stack, microseconds in collapsed_stacks(stats.stats):
+            collapsed_file.write(f"{stack} {microseconds}\n")
+
+    allocations = after.compare_to(before, 'lineno')[:TOP_ALLOCATIONS]
+    with open(prefix + '.alloc.txt', 'w') as alloc_file:
+        alloc_file.write(f"{name}: {elapsed:.3f}s, peak traced memory {peak / 1024 / 1024:.1f} MB\n\n")
+        for allocation in allocations:
+            alloc_file.write(f"{allocation}\n")
+
+    with open(os.path.join(_report_dir, 'summary.txt'), 'a') as summary_file:
+        summary_file.write(f"{os.path.basename(prefix)}: {elapsed:.3f}s, peak {peak / 1024 / 1024:.1f} MB\n")
+
+
+def _label(func):
+    filename, lineno, funcname = func
+    if filename == '~':
+        return funcname.replace(';', ',')
+    return f"{funcname} ({os.path.basename(filename)}:{lineno})".replace(';', ',')
+
+
+def collapsed_stacks(raw_stats, max_depth=64):
+    # cProfile only keeps caller -> callee edges, not whole stacks, so stacks are
+    # rebuilt by walking the call graph from its roots and splitting each
+    # function's time across its callers in proportion to the edge times.
+    # Branches worth less than MIN_STACK_SECONDS are dropped, which keeps the
+    # walk from visiting every path through a large call graph.
+    callees = {}
+    for func, (_, _, _, _, callers) in raw_stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge))
+
+    lines = {}  # Identical stacks reached along different paths are added up
+
+    def walk(func, stack, self_time, total_time):
+        stack = stack + [_label(func)]
+        if self_time > 0:
+            key = ";".join(stack)
+            lines[key] = lines.get(key, 0) + self_time
+        if len(stack) >= max_depth:
+            return
+        func_total = raw_stats[func][3]
+        share = total_time / func_total if func_total else 0
+        for callee, (_, _, edge_self, edge_total) in callees.get(func, []):
+            if edge_total * share < MIN_STACK_SECONDS or _label(callee) in stack:
+                continue  # Negligible, or recursion already counted higher up
+            walk(callee, stack, edge_self * share, edge_total * share)
+
+    for func, (_, _, self_time, total_time, callers) in raw_stats.items():
+        if not callers:
+            walk(func, [], self_time, total_time)
+    microseconds = ((stack, int(seconds * 1_000_000)) for stack, seconds in lines.items())
+    return [line for line in microseconds if line[1] > 0]
@@ -0,0 +1,151 @@
+import os
+import io
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# On-disk cache of display thumbnails shared by both GUIs.
+# Entries are keyed by path, file size, mtime and thumbnail size, so an edited
+# photo gets a fresh entry and the stale one is eventually evicted.
+
+DEFAULT_CACHE_DIR = os.getenv('THUMBNAIL_CACHE_DIR', '.thumbcache')
+DEFAULT_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_MB', '200')) * 1024 * 1024
+
+ORIENTATION_TAG = 274
+
+
+def apply_exif_orientation(image):
+    # Rotate the image according to its EXIF Orientation tag
+    try:
+        orientation = image.getexif().get(ORIENTATION_TAG)
+    except (AttributeError, KeyError, IndexError, OSError):
+        # In case there's no EXIF or it can't be read
+        return image
+    if orientation == 3:
+        image = image.rotate(180, expand=True)
+    elif orientation == 6:
+        image = image.rotate(270, expand=True)
+    elif orientation == 8:
+        image = image.rotate(90, expand=True)
+    return image
+
+
+def render_thumbnail(image_path, max_size):
+    # Decode, orient and shrink an image without touching the cache
+    image = Image.open(image_path)
+    # Let the JPEG decoder downscale while decoding, much cheaper than a full decode
+    image.draft('RGB', (max_size, max_size))
+    image = apply_exif_orientation(image)
+    image.thumbnail((max_size, max_size))
+    return image
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # key -> file size, ordered from least to most recently used
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self._load_index()
+
+    def _load_index(self):
+        # Rebuild the LRU order from the files' mtimes (bumped on every hit)
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.jpg'):
+                stat = entry.stat()
+                found.append((stat.st_mtime_ns, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def _key(self, image_path, max_size):
+        stat = os.stat(image_path)
+        raw = f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}|{max_size}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.jpg')
+
+    def get_bytes(self, image_path, max_size):
+        # Return the JPEG-encoded thumbnail, rendering and storing it on a miss
+        key = self._key(image_path, max_size)
+        cached_path = self._path(key)
+        try:
+            with open(cached_path, 'rb') as cached_file:
+                data = cached_file.read()
+            self._touch(key, cached_path, len(data))
+            return data
+        except FileNotFoundError:
+            pass
+
+        image = render_thumbnail(image_path, max_size)
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, format='JPEG', quality=90)
+        data = buffer.getvalue()
+        self._store(key, cached_path, data)
+        return data
+
+    def get_image(self, image_path, max_size):
+        image = Image.open(io.BytesIO(self.get_bytes(image_path, max_size)))
+        image.load()
+        return image
+
+    def _touch(self, key, cached_path, size):
+        with self.lock:
+            if key not in self.entries:
+                # Written by another process since we started
+                self.total_bytes += size
+            self.entries[key] = size
+            self.entries.move_to_end(key)
+        try:
+            os.utime(cached_path)
+        except OSError:
+            pass
+
+    def _store(self, key, cached_path, data):
+        # Write to a temp file and rename so readers never see a partial thumbnail,
+        # even when several processes share the cache directory
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, cached_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.get(key, 0)
+            self.entries[key] = len(data)
+            self.entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        # Drop least recently used thumbnails until we are under the size cap
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            self.entries.clear()
+            self.total_bytes = 0
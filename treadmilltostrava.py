@@ -1,9 +1,18 @@
-from google.cloud import vision
+from ocrclient import default_ocr
+import profiling
 from PIL import Image
 from PIL.ExifTags import TAGS, GPSTAGS
 import io
 import re
 import os 
+import sys
+import json
+import queue
+import argparse
+import threading
+import contextlib
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from requests_oauthlib import OAuth2Session
 import requests
@@ -18,6 +27,9 @@ STRAVA_API_URL = "https://www.strava.com/api/v3"
 STRAVA_AUTH_URL = "https://www.strava.com/oauth/authorize"
 STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
 
+# Short clips of the treadmill screen are accepted too; the sharpest frame is used
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.avi', '.mkv', '.3gp')
+
 def refresh_access_token():
     global access_token  # Ensure you update the global access_token variable
     token_url = STRAVA_TOKEN_URL
@@ -90,9 +102,9 @@ def get_strava_access_token():
     return access_token
 
 def get_image_datetime(image_path):
-    # Open the image and get the EXIF data
-    image = Image.open(image_path)
-    exif_data = image._getexif()
+    # Open the image and get the EXIF data (closing it so batch runs don't leak file handles)
+    with Image.open(image_path) as image:
+        exif_data = image._getexif()
     
     if not exif_data:
         raise ValueError("No EXIF data found in image.")
@@ -106,7 +118,32 @@ def get_image_datetime(image_path):
     
     raise ValueError("No DateTimeOriginal tag found in EXIF data.")
 
-def upload_activity_to_strava(time,distance):
+def get_capture_datetime(path):
+    # When the photo (EXIF) or the video clip (container metadata) was taken
+    if path.lower().endswith(VIDEO_EXTENSIONS):
+        import videoframes  # Needs PyAV, so only loaded for videos
+        return videoframes.get_video_datetime(path)
+    return get_image_datetime(path)
+
+def build_activity_data(time, distance, image_path, title="Treadmill Run", description="Uploaded from TreadmilltoStrava",
+                        start_date_local=None):
+    # Extract the date and time when the picture was taken, unless the caller already has it
+    if start_date_local is None:
+        start_date_local = get_capture_datetime(image_path)
+    # Ensure the format is correct for Strava (ISO 8601 format)
+    start_date_local = datetime.strptime(start_date_local, "%Y:%m:%d %H:%M:%S").isoformat() + "Z"
+    
+    return {
+        "name": title,
+        "type": "Run",
+        "start_date_local": start_date_local,
+        "elapsed_time": convert_time_to_seconds(time),
+        "distance": float(distance) * 1000,
+        "description": description,
+    }
+
+def upload_activity_to_strava(time, distance, image_path, title="Treadmill Run", description="Uploaded from TreadmilltoStrava",
+                              start_date_local=None):
     global access_token
     if not access_token:
         print("Access token not found. Please authenticate.")
@@ -129,23 +166,12 @@ def upload_activity_to_strava(time,distance):
             print("Failed to authenticate with the refreshed token.")
             return
         
-    # Extract the date and time when the picture was taken
     try:
-        start_date_local = get_image_datetime(image_path)
-        # Ensure the format is correct for Strava (ISO 8601 format)
-        start_date_local = datetime.strptime(start_date_local, "%Y:%m:%d %H:%M:%S").isoformat() + "Z"
+        activity_data = build_activity_data(time, distance, image_path, title, description, start_date_local)
     except ValueError as e:
         print(f"Error extracting date and time from image: {e}")
         return
     
-    activity_data = {
-        "name": "Treadmill Run",
-        "type": "Run",
-        "start_date_local": start_date_local,
-        "elapsed_time": convert_time_to_seconds(time),
-        "distance": float(distance) * 1000,
-        "description": "Uploaded from TreadmilltoStrava",
-    }
     response = requests.post(f"{STRAVA_API_URL}/activities", headers=headers, data=activity_data)
     if response.status_code == 201:
         print("Activity uploaded successfully!")
@@ -156,19 +182,37 @@ def upload_activity_to_strava(time,distance):
 
         print(f"Remaining requests: {remaining}")
         print(f"Rate limit reset time: {reset_time}")
+    return response
     
 def extract_text_from_image(image_path):
-    client=vision.ImageAnnotatorClient()
     with io.open(image_path, 'rb') as image_file:
         content = image_file.read()
-    image = vision.Image(content=content)
-    response = client.text_detection(image=image)
-    texts = response.text_annotations
+    return extract_text_from_bytes(content)
+
+def extract_text_from_video(video_path):
+    # OCR the sharpest frames of a short clip, best first, until one has both readouts
+    import videoframes  # Needs PyAV, so only loaded for videos
+    text = 'No text found'
+    for frame in videoframes.best_frames(video_path):
+        text = extract_text_from_bytes(frame["content"])
+        time, distance = extract_time_and_distance(text)
+        if time != 'Time not found' and distance != 'Distance not found':
+            break
+    return text
+
+def extract_text_from_bytes(content):
+    # OCR an already encoded image, e.g. one preprocessed by imagepool
+    texts = detect_text_annotations(content)
     if texts:
         return texts[0].description.replace(" ", "")
     else:
         return 'No text found'
     
+def detect_text_annotations(content):
+    # Full text first, then one annotation per word with its bounding box
+    # Goes through the shared client with deadlines, hedging and a circuit breaker
+    return default_ocr.text_detection(content)
+    
 def extract_time_and_distance(text):
     time_pattern = r'\b(\d{2}:\d{2})\b'
     distance_pattern = r"(\d{1,2}\.\d{2})"
@@ -184,14 +228,119 @@ def convert_time_to_seconds(time):
     return int(minutes) * 60 + int(seconds)
 
 
-def main(image_path):
-    text = extract_text_from_image(image_path)
-    if text:
+def process_image(image_path, dry_run=False, title="Treadmill Run", description="Uploaded from TreadmilltoStrava"):
+    # Run one image through every step and report what happened, with per-stage timings
+    result = {"path": image_path, "timings": {}}
+    timings = result["timings"]
+    try:
+        start = perf_counter()
+        try:
+            result["start_date_local"] = datetime.strptime(
+                get_capture_datetime(image_path), "%Y:%m:%d %H:%M:%S").isoformat()
+        except ValueError:
+            result["start_date_local"] = None
+        timings["exif"] = round(perf_counter() - start, 4)
+
+        start = perf_counter()
+        if image_path.lower().endswith(VIDEO_EXTENSIONS):
+            text = extract_text_from_video(image_path)
+        else:
+            text = extract_text_from_image(image_path)
+        timings["ocr"] = round(perf_counter() - start, 4)
+
+        start = perf_counter()
         time, distance = extract_time_and_distance(text)
-        print(f'Time: {time}, Distance: {distance}')
-        if time != 'Time not found' and distance != 'Distance not found':
-            upload_activity_to_strava(time, distance)
+        timings["parse"] = round(perf_counter() - start, 4)
+        result["time"] = time
+        result["distance"] = distance
+        if time == 'Time not found' or distance == 'Distance not found':
+            result["error"] = "Time or distance not found"
+            return result
+        result["elapsed_time"] = convert_time_to_seconds(time)
+
+        if dry_run:
+            result["upload"] = None
+            return result
+        start = perf_counter()
+        response = upload_activity_to_strava(time, distance, image_path, title, description)
+        timings["upload"] = round(perf_counter() - start, 4)
+        if response is None:
+            result["upload"] = {"status_code": None}
+            result["error"] = "Upload failed (authentication or capture date)"
+        else:
+            result["upload"] = {"status_code": response.status_code}
+            if response.status_code == 201:
+                result["upload"]["activity_id"] = response.json().get("id")
+            else:
+                result["error"] = f"Upload failed with status {response.status_code}"
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def read_paths(sources):
+    # Paths from the command line, with "-" meaning one path per line on stdin
+    for source in sources:
+        if source == '-':
+            for line in sys.stdin:
+                line = line.strip()
+                if line:
+                    yield line
+        else:
+            yield source
+
+
+def stream_results(image_paths, parallel=1, dry_run=False):
+    # Yield each result as soon as it finishes, out of order. Paths are read on
+    # a feeder thread with only a couple of images per worker in flight, so a
+    # long list of paths is never buffered, and a caller that waits for each
+    # result before sending the next path still gets it straight away.
+    finished = queue.Queue()  # Completed futures, then None once feeding stops
+    slots = threading.Semaphore(parallel * 2)
+    feed_state = {"submitted": 0, "error": None}
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        def feed():
+            try:
+                for image_path in image_paths:
+                    slots.acquire()
+                    future = executor.submit(process_image, image_path, dry_run)
+                    feed_state["submitted"] += 1
+                    future.add_done_callback(finished.put)
+            except Exception as e:
+                feed_state["error"] = e
+            finally:
+                finished.put(None)
+
+        threading.Thread(target=feed, daemon=True).start()
+        received, total = 0, None
+        while total is None or received < total:
+            future = finished.get()
+            if future is None:
+                total = feed_state["submitted"]
+                continue
+            received += 1
+            slots.release()
+            yield future.result()
+    if feed_state["error"] is not None:
+        raise feed_state["error"]
+
 
 if __name__ == '__main__':
-    image_path = "pics\\treadmill2.jpg"
-    main(image_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description="Read treadmill photos and upload them to Strava, writing one JSON line per image")
+    parser.add_argument('paths', nargs='*', default=['-'], help="Image paths, or - to read paths from stdin (default)")
+    parser.add_argument('--dry-run', action='store_true', help="Extract and parse, but don't upload")
+    parser.add_argument('--parallel', type=int, default=1, metavar='N', help="Images to process at once")
+    parser.add_argument('--profile', metavar='DIR', help=f"Write cProfile/tracemalloc reports to DIR (or set {profiling.PROFILE_ENV})")
+    args = parser.parse_args()
+
+    profiling.setup(args.profile)
+    profiling.instrument(sys.modules[__name__], ['process_image', 'extract_text_from_image', 'upload_activity_to_strava'])
+
+    # Keep stdout for results only; progress messages go to stderr
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        for result in stream_results(read_paths(args.paths), max(1, args.parallel), args.dry_run):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
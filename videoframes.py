@@ -0,0 +1,110 @@
+import io
+import sys
+import time
+import heapq
+import argparse
+from datetime import datetime, timezone
+from duplicates import laplacian_variance
+
+try:
+    import av  # PyAV, only needed for video clips
+except ImportError:
+    av = None
+
+# Sharpest-frame extraction from short treadmill videos. Backlit LCDs often come
+# out blurry or mid-refresh in a single photo; a few seconds of video almost
+# always contains a clean frame. Frames are decoded one at a time, scored on a
+# small grayscale copy, and only the best few are kept (as JPEG bytes), so
+# memory stays within a fixed budget whatever the clip length.
+
+SCORE_WIDTH = 480  # Frames are scored at this width; plenty to tell sharp from blurry
+# Every decoded frame is scored by default: the clean window between LCD
+# refreshes can be a single frame, and scoring is cheap next to decoding.
+# Set a rate to score fewer frames of long clips.
+DEFAULT_SAMPLE_FPS = None
+DEFAULT_KEEP = 2
+DEFAULT_MAX_SIZE = 1600  # Long edge of the frames kept for OCR
+DEFAULT_MEMORY_BUDGET = 16 * 1024 * 1024  # Bytes of kept frames
+
+
+def _open(video_path):
+    if av is None:
+        raise ValueError("Video support needs PyAV: pip install av")
+    return av.open(video_path)
+
+
+def _encode(frame, max_size):
+    image = frame.to_image()
+    image.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def best_frames(video_path, keep=DEFAULT_KEEP, sample_fps=DEFAULT_SAMPLE_FPS,
+                max_size=DEFAULT_MAX_SIZE, memory_budget=DEFAULT_MEMORY_BUDGET):
+    # The `keep` sharpest frames, sharpest first, as dicts with the JPEG bytes
+    kept = []  # Min-heap of (score, index, time, content)
+    kept_bytes = 0
+    with _open(video_path) as container:
+        stream = container.streams.video[0]
+        fps = float(stream.average_rate or 30)
+        step = max(1, round(fps / sample_fps)) if sample_fps else 1
+        for index, frame in enumerate(container.decode(stream)):
+            if index % step:
+                continue
+            height = max(2, round(frame.height * SCORE_WIDTH / frame.width))
+            gray = frame.to_ndarray(format='gray', width=SCORE_WIDTH, height=height)
+            score = laplacian_variance(gray)
+            if len(kept) == keep and score <= kept[0][0]:
+                continue
+
+            # Only frames that make the cut are converted at full size
+            content = _encode(frame, max_size)
+            entry = (score, index, frame.time or 0.0, content)
+            if len(kept) < keep:
+                heapq.heappush(kept, entry)
+            else:
+                kept_bytes -= len(heapq.heapreplace(kept, entry)[3])
+            kept_bytes += len(content)
+            while kept_bytes > memory_budget and len(kept) > 1:
+                kept_bytes -= len(heapq.heappop(kept)[3])
+
+    return [
+        {"index": index, "time": frame_time, "score": score, "content": content}
+        for score, index, frame_time, content in sorted(kept, reverse=True)
+    ]
+
+
+def get_video_datetime(video_path):
+    # Recording time in the same "YYYY:MM:DD HH:MM:SS" local-time form as EXIF DateTimeOriginal.
+    # MP4/MOV creation_time is UTC, so it is converted to this machine's time zone.
+    with _open(video_path) as container:
+        creation_time = container.metadata.get('creation_time')
+    if not creation_time:
+        raise ValueError("No creation time found in video metadata.")
+    recorded = datetime.strptime(creation_time[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    return recorded.astimezone().strftime("%Y:%m:%d %H:%M:%S")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pick the sharpest frames of a treadmill video")
+    parser.add_argument('video')
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP)
+    parser.add_argument('--sample-fps', type=float, default=DEFAULT_SAMPLE_FPS,
+                        help="Score at most this many frames per second (default: every frame)")
+    parser.add_argument('--save', metavar='PREFIX', help="Write the kept frames to PREFIX-<n>.jpg")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    frames = best_frames(args.video, args.keep, args.sample_fps)
+    elapsed = time.perf_counter() - start
+    with _open(args.video) as container:
+        duration = float(container.duration or 0) / 1_000_000  # Container duration is in microseconds
+    for n, frame in enumerate(frames):
+        print(f"frame {frame['index']} at {frame['time']:.2f}s: sharpness {frame['score']:.1f}")
+        if args.save:
+            with open(f"{args.save}-{n}.jpg", 'wb') as frame_file:
+                frame_file.write(frame['content'])
+    speed = f" ({duration / elapsed:.1f}x real time)" if duration else ""
+    print(f"Processed in {elapsed:.2f}s{speed}", file=sys.stderr)